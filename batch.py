@@ -0,0 +1,427 @@
+import numpy as np
+
+# Sum of the set bit positions and number of set bits of every byte, used to
+# score bitmask hands eight cards at a time.
+_BYTE_POPCOUNT = np.array([bin(b).count('1') for b in range(256)], \
+                          dtype=np.int64)
+_BYTE_POS_SUM = np.array([sum(i for i in range(8) if b >> i & 1) \
+                          for b in range(256)], dtype=np.int64)
+
+# Order of the threshold columns in BatchTable.thresholds.
+THRESHOLDS = ('init_threshold', 'eff_val_threshold', 'token_threshold', \
+              'pot_threshold')
+
+
+class BatchTable(object):
+    """Many games of No Thanks played in lockstep on NumPy arrays.
+
+    Every game applies the same decision rules as Table.step() (including
+    milking_potential() and vindictive_potential()), but the rules are
+    evaluated as vectorized masks over all unfinished games, so each call to
+    step() advances every game by one decision.
+
+    The per-game state arrays hold n rows, row k being game ids[k]. Finished
+    games are periodically dropped from them; their final hands and tokens
+    are kept in final_hands and final_tokens. Per-seat state is stored
+    seat-major, (num_players, n), so every elementwise operation runs along
+    a long contiguous axis, and small integer types are used wherever they
+    fit. Effective values are kept as exact integers in units of
+    1/tot_orig_cards, so decisions match Table's up to float rounding in
+    Table.get_effective_value().
+
+    Attributes:
+      num_games (int)
+      num_players (int)
+      decks (ndarray[int8], shape (num_games, tot_cards)): dealt decks,
+              discards already removed
+      init_threshold, eff_val_threshold, token_threshold, pot_threshold
+              (ndarray[int16], shape (num_games, num_players))
+      final_hands, final_tokens (ndarray[int64],
+              shape (num_games, num_players))
+      ids (ndarray[int64], shape (n,)): game of each row of the state arrays
+      live (ndarray[bool], shape (n,)): False for finished games that have
+              not been dropped yet
+      cursor (ndarray[int16], shape (n,)): index of the next card to draw
+      card_up (ndarray[int8], shape (n,))
+      hands (ndarray[int64], shape (num_players, n)): bitmask hands
+              (bit c set if card c is held, see Player.hand)
+      held (ndarray[int64], shape (n,)): union of all hands
+      tokens (ndarray[int16], shape (num_players, n))
+      pot (ndarray[int16], shape (n,))
+      whose_turn (ndarray[int16], shape (n,))
+      runs (ndarray[int16], shape (num_players, n)): sum of the lowest card
+              of every run in each hand (the score before tokens)
+      thresholds (ndarray[int16], shape (num_players, 4, n)): thresholds of
+              every seat, in the order of THRESHOLDS
+
+    Methods:
+      step()
+      run()
+      score()
+    """
+
+    def __init__(self, num_games, num_players=3, num_cards=33, offset=3, \
+                 dis=9, thresholds=None, rng=None):
+        """
+        Args:
+          num_games (int): number of games to play at once
+          num_players (int): number of players at every table
+          num_cards (int): number of cards in the setup deck (prior to
+                  discarding)
+          offset (int): the lowest card value
+          dis (int): number of cards to discard
+          thresholds (dict): optional arrays (or scalars) keyed by
+                  'init_threshold', 'eff_val_threshold', 'token_threshold'
+                  and 'pot_threshold', broadcastable to
+                  (num_games, num_players). Missing thresholds are drawn from
+                  the same distributions as Table.add_player().
+          rng (numpy.random.Generator or int): random generator, or a seed
+                  for a new one
+        """
+        if num_games < 1:
+            raise ValueError("BatchTable needs at least 1 game")
+        if num_players < 1:
+            raise ValueError("BatchTable needs at least 1 player")
+        if num_cards < 1:
+            raise ValueError("Cannot deal a deck with less than 1 card")
+        if offset < 1:
+            raise ValueError("A positive offset value is required")
+        if num_cards <= dis:
+            raise ValueError("Discarding all the cards...")
+        # Hands are int64 bitmasks, shifted left by 2 during evaluation.
+        if num_cards + offset - 1 > 60:
+            raise ValueError("BatchTable supports card values up to 60")
+        if not isinstance(rng, np.random.Generator):
+            rng = np.random.default_rng(rng)
+        self.rng = rng
+        self.num_games = num_games
+        self.num_players = num_players
+        self.min_card = offset
+        self.max_card = num_cards + offset - 1
+        self.tot_orig_cards = num_cards
+        self.tot_cards = num_cards - dis
+
+        shape = (num_games, num_players)
+        defaults = {
+            'init_threshold': (self.min_card, self.max_card),
+            'eff_val_threshold': (0, 9),
+            'token_threshold': (0, 9),
+            'pot_threshold': (6, 21),
+        }
+        if thresholds is None:
+            thresholds = {}
+        for name in THRESHOLDS:
+            if name in thresholds:
+                value = np.broadcast_to(
+                    np.asarray(thresholds[name], dtype=np.int16), shape).copy()
+            else:
+                low, high = defaults[name]
+                value = rng.integers(low, high, size=shape, dtype=np.int16)
+            setattr(self, name, value)
+        if (self.token_threshold > 10).any() or (self.token_threshold < 0).any():
+            raise ValueError("token_threshold must be 0-10")
+
+        cards = np.arange(offset, offset + num_cards, dtype=np.int8)
+        decks = rng.permuted(np.broadcast_to(cards, (num_games, num_cards)), \
+                             axis=1)
+        self.decks = np.ascontiguousarray(decks[:, dis:])
+        self.final_hands = np.zeros(shape, dtype=np.int64)
+        self.final_tokens = np.zeros(shape, dtype=np.int64)
+
+        self.ids = np.arange(num_games)
+        self.live = np.ones(num_games, dtype=bool)
+        self.num_live = num_games
+        self.card_up = self.decks[:, 0].copy()
+        self.cursor = np.ones(num_games, dtype=np.int16)
+        self.hands = np.zeros(shape[::-1], dtype=np.int64)
+        self.held = np.zeros(num_games, dtype=np.int64)
+        self.tokens = np.full(shape[::-1], 11, dtype=np.int16)
+        self.runs = np.zeros(shape[::-1], dtype=np.int16)
+        self.pot = np.zeros(num_games, dtype=np.int16)
+        self.whose_turn = np.zeros(num_games, dtype=np.int16)
+        self.thresholds = np.stack([getattr(self, name) for name in THRESHOLDS],
+                                   axis=2).transpose(1, 2, 0).copy()
+
+    @staticmethod
+    def hand_scores(hands, tokens):
+        """
+        Vectorized Player.get_score(): sum of the lowest card of every run,
+        minus tokens, or 0 for an empty hand.
+        """
+        heads = hands & ~(hands << 1)
+        tot = np.zeros(hands.shape, dtype=np.int64)
+        shift = 0
+        while (heads >> shift).any():
+            byte = (heads >> shift) & 0xff
+            tot += _BYTE_POS_SUM[byte] + shift * _BYTE_POPCOUNT[byte]
+            shift += 8
+        return np.where(hands == 0, 0, tot - tokens)
+
+    def current(self, a, seats):
+        """
+        Select one player's entry of a per-seat array a, shaped
+        (num_players, ..., n), for each row, given the boolean mask seats
+        (num_players, n) of that player.
+        """
+        out = a[0] * seats[0]
+        for seat in range(1, self.num_players):
+            out += a[seat] * seats[seat]
+        return out
+
+    def effective_values(self, hands, others, card_up, pot, remaining):
+        """
+        Vectorized Table.get_effective_value(), in units of
+        1/tot_orig_cards so that it stays integer. All arguments must
+        broadcast against hands; others is the bitmask of cards held by
+        everyone but the current player.
+
+        Selections are written as arithmetic on masks rather than
+        np.where(), which is much slower on unpredictable masks.
+
+        Returns:
+          ndarray[int32] of the shape of hands
+        """
+        T = self.tot_orig_cards
+        c = card_up.astype(np.int32)
+        nbrs = ((hands << 2) >> card_up.astype(np.int64)) & 0b11111
+        above = (nbrs & 0b01000) != 0
+        below = (nbrs & 0b00010) != 0
+        two_free = ((nbrs & 0b11010) == 0b10000) \
+                   & (((others >> (c + 1)) & 1) == 0)
+        remaining = remaining.astype(np.int32)
+        # Not adjacent: c, or the expectation value -2*prob + c*(1 - prob),
+        # prob = remaining / T, if the card two above is held and the
+        # bridging card is still unclaimed.
+        eff = (~(above | below)) * (c * T - two_free * ((c + 2) * remaining))
+        # Adjacent below a run: -1, or -(c + 1) if it bridges two runs.
+        # Adjacent above a run only: 0.
+        eff -= above * (T + below * (c * T))
+        return eff - pot * T
+
+    def milking_potential(self, r, turn, others, remaining, pot_threshold):
+        """
+        Vectorized Table.milking_potential() for the rows r.
+        """
+        P = self.num_players
+        T = self.tot_orig_cards
+        pot = self.pot[r]
+        card_up = self.card_up[r]
+        # The current player holds cards in this branch, so the others all
+        # hold cards if every hand is non-empty.
+        milk = pot <= pot_threshold
+        for seat in range(P):
+            milk &= self.hands[seat, r] != 0
+        forced = milk & (card_up == self.max_card) \
+                 & ((remaining == 0) | (pot < pot_threshold))
+        walk = milk & ~forced
+        if walk.any():
+            w = np.flatnonzero(walk)
+            r, turn = r[w], turn[w]
+            eff = self.effective_values(self.hands[:, r], others[w], \
+                                        card_up[w], pot[w], remaining[w])
+            tokens = self.tokens[:, r]
+            seat_numbers = np.arange(P)[:, None]
+            comes_back = np.ones(len(w), dtype=bool)
+            for j in range(1, P):
+                seats = seat_numbers == (turn + j) % P
+                comes_back &= (self.current(tokens, seats) != 0) \
+                              & (self.current(eff, seats) >= (j + 7) * T)
+            walk[w] = comes_back
+        return forced | walk
+
+    def vindictive_potential(self, r, turn, others, remaining):
+        """Vectorized Table.vindictive_potential() for the rows r."""
+        hands = self.hands[:, r]
+        thresh = self.rng.integers(20, 41, size=len(r))
+        scores = (self.runs[:, r] - self.tokens[:, r]) * (hands != 0)
+        is_other = np.arange(self.num_players)[:, None] != turn
+        own = self.current(scores, ~is_other)
+        losing = ((scores + thresh <= own) | ~is_other).all(axis=0)
+        eff = self.effective_values(hands, others, self.card_up[r], \
+                                    self.pot[r], remaining)
+        val = (eff * is_other).min(axis=0)
+        return losing & (val < 0)
+
+    def step(self):
+        """
+        Make one take/pass decision in every unfinished game.
+
+        Returns:
+            int: number of games still in progress
+        """
+        if self.num_live == 0:
+            return 0
+        P = self.num_players
+        T = self.tot_orig_cards
+        live = self.live
+        turn = self.whose_turn
+        card_up = self.card_up
+        pot = self.pot
+        remaining = self.tot_cards - self.cursor
+        seats = np.arange(P, dtype=turn.dtype)[:, None] == turn
+        own = self.current(self.hands, seats)
+        others = self.held ^ own
+        tokens = self.current(self.tokens, seats)
+        init_threshold, eff_val_threshold, token_threshold, pot_threshold = \
+            self.current(self.thresholds, seats)
+        eff = self.effective_values(own, others, card_up, pot, remaining)
+
+        no_tokens = live & (tokens == 0)
+        for_pot = live & ~no_tokens & (tokens < token_threshold) \
+                  & (pot > pot_threshold) & (remaining > 9) \
+                  & (card_up != self.max_card)
+        rest = live & ~(no_tokens | for_pot)
+        first = rest & (own == 0)
+        rest &= ~first
+        take = no_tokens | for_pot | (first & (eff <= init_threshold * T))
+
+        low = rest & (eff < T)
+        if low.any():
+            r = np.flatnonzero(low)
+            milk = self.milking_potential(r, turn[r], others[r], \
+                                          remaining[r], pot_threshold[r])
+            take[r[~milk]] = True
+        rest &= ~low
+
+        below_free = ((others >> (card_up - 1).astype(np.int64)) & 1) == 0
+        cheap = rest & (remaining > 0) & below_free \
+                & (eff <= eff_val_threshold * T)
+        take |= cheap
+        rest &= ~cheap
+
+        # Don't be vindictive until late in the game.
+        rest &= remaining <= P
+        if rest.any():
+            r = np.flatnonzero(rest)
+            vind = self.vindictive_potential(r, turn[r], others[r], remaining[r])
+            take[r[vind]] = True
+
+        # Apply passes and takes to the current player's column only. The
+        # card changes the sum of run heads like its effective value without
+        # the pot: by -(c + 1) if it bridges two runs, -1 below a run, 0
+        # above a run and c on its own.
+        passing = live & ~take
+        bits = take * np.left_shift(np.int64(1), card_up)
+        nbrs = (own >> (card_up - 1).astype(np.int64)) & 0b101
+        above = (nbrs & 0b100) != 0
+        c = card_up.astype(np.int16)
+        self.runs += (seats * take) * ((nbrs == 0) * c - above * (1 + (nbrs == 0b101) * c))
+        self.hands |= seats * bits
+        self.held |= bits
+        self.tokens += seats * (take * pot - passing)
+        self.pot = (pot + 1) * passing
+        turn += passing
+        turn -= (turn == P) * P
+
+        # Draw the next card for every game in which a card was taken.
+        t = np.flatnonzero(take)
+        empty = self.cursor[t] >= self.tot_cards
+        d = t[~empty]
+        card_up[d] = self.decks.reshape(-1)[self.ids[d] * self.tot_cards \
+                                            + self.cursor[d]]
+        self.cursor[d] += 1
+
+        if empty.any():
+            done = t[empty]
+            self.final_hands[self.ids[done]] = self.hands[:, done].T
+            self.final_tokens[self.ids[done]] = self.tokens[:, done].T
+            live[done] = False
+            self.num_live -= len(done)
+            # Drop finished games from the state arrays once enough of them
+            # have piled up to be worth the copy.
+            if self.num_live < 0.75 * len(live):
+                for name in ('ids', 'live', 'card_up', 'cursor', 'hands', \
+                             'held', 'tokens', 'runs', 'pot', 'whose_turn', \
+                             'thresholds'):
+                    setattr(self, name, getattr(self, name)[..., live])
+        return self.num_live
+
+    def run(self):
+        """Step every game until all of them are over."""
+        while self.step():
+            pass
+        return 0
+
+    def score(self):
+        """
+        Final scores and results of every game, as Table.score() computes
+        them with verbose=0.
+
+        Returns:
+            dict of ndarray, each of shape (num_games, num_players):
+              'win': 0 = lost, 1 = won, 2 = tied
+              'score': final score
+              'tokens': final number of tokens
+              'hand': bitmask of the final hand
+        """
+        scores = self.hand_scores(self.final_hands, self.final_tokens)
+        winners = scores == scores.min(axis=1, keepdims=True)
+        tied = winners.sum(axis=1, keepdims=True) > 1
+        win = np.where(winners, np.where(tied, 2, 1), 0)
+        return {'win': win, 'score': scores, \
+                'tokens': self.final_tokens.copy(), \
+                'hand': self.final_hands.copy()}
+
+
+def cross_check(num_games=20000, num_players=3, seed=None):
+    """
+    Check that BatchTable is statistically equivalent to Table by playing
+    num_games games on each and comparing the mean score and win rate of
+    every position.
+
+    Returns:
+        list of (pos, statistic, table mean, batch mean, z-score)
+    """
+    import random
+    from table import Table
+
+    random.seed(seed)
+    scalar_scores = np.zeros((num_games, num_players))
+    scalar_wins = np.zeros((num_games, num_players))
+    for n in range(num_games):
+        mytable = Table(num_ai_players=num_players, verbose=0)
+        mytable.play()
+        for player in mytable.score():
+            scalar_wins[n, player[2]] = player[0] > 0
+            scalar_scores[n, player[2]] = player[1]
+
+    batch = BatchTable(num_games, num_players, rng=seed)
+    batch.run()
+    results = batch.score()
+    batch_scores = results['score']
+    batch_wins = results['win'] > 0
+
+    report = []
+    for pos in range(num_players):
+        for name, a, b in (('score', scalar_scores[:, pos], batch_scores[:, pos]),
+                           ('win', scalar_wins[:, pos], batch_wins[:, pos])):
+            se = np.sqrt(a.var(ddof=1) / len(a) + b.var(ddof=1) / len(b))
+            z = (b.mean() - a.mean()) / se if se > 0 else 0.0
+            report.append((pos, name, a.mean(), b.mean(), z))
+    return report
+
+
+if __name__ == "__main__":
+    import time
+    from table import Table
+
+    num_games = 20000
+    print('{0:3}  {1:5}  {2:>8}  {3:>8}  {4:>6}'\
+          .format('Pos', 'Stat', 'Table', 'Batch', 'z'))
+    for pos, name, a, b, z in cross_check(num_games):
+        print('{0:3d}  {1:5}  {2:8.3f}  {3:8.3f}  {4:6.2f}'\
+              .format(pos, name, a, b, z))
+
+    start = time.perf_counter()
+    for n in range(2000):
+        mytable = Table(num_ai_players=3, verbose=0)
+        mytable.play()
+        mytable.score()
+    scalar_rate = 2000 / (time.perf_counter() - start)
+    start = time.perf_counter()
+    batch = BatchTable(100000, 3)
+    batch.run()
+    batch.score()
+    batch_rate = 100000 / (time.perf_counter() - start)
+    print("\nTable: {0:.0f} games/sec, BatchTable: {1:.0f} games/sec ({2:.0f}x)"\
+          .format(scalar_rate, batch_rate, batch_rate / scalar_rate))
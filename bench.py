@@ -0,0 +1,312 @@
+#!/usr/bin/python3
+"""Benchmarks of the simulator's hot paths.
+
+Every benchmark runs from fixed seeds, so results from different commits
+measure the same work. Results are written as JSON and can be compared with
+an earlier run:
+
+    ./bench.py --output before.json
+    ./bench.py --output after.json --compare before.json --threshold 0.1
+
+The comparison exits with status 1 if any benchmark got worse by more than
+the threshold (a fraction).
+"""
+import sys
+import json
+import time
+import random
+import timeit
+import argparse
+import platform
+import subprocess
+import tracemalloc
+from deck import Deck
+from player import Player
+from table import Table
+
+
+def best_rate(func, number, repeat):
+    """Best calls per second of func over repeat runs of number calls."""
+    times = timeit.Timer(func).repeat(repeat=repeat, number=number)
+    return number / min(times)
+
+
+def best_time(func, number, repeat):
+    """Best time per call of func, in microseconds."""
+    times = timeit.Timer(func).repeat(repeat=repeat, number=number)
+    return 1e6 * min(times) / number
+
+
+def games_per_sec(num_players, games=2000, repeat=3, seed=0):
+    """End-to-end games/sec of Table(verbose=0).play() and score()."""
+    def play():
+        for game in range(games):
+            mytable = Table(num_ai_players=num_players, verbose=0, \
+                            rng=random.Random("{}:{}".format(seed, game)))
+            mytable.play()
+            mytable.score()
+    return games * best_rate(play, 1, repeat)
+
+
+def turn_cost(num_players, num_cards, games=300, repeat=3, seed=0):
+    """
+    Time per decision, in microseconds, of games with num_players players
+    and a deck of num_cards cards (a quarter of them discarded). Setting
+    up the tables is not timed.
+    """
+    best = None
+    for r in range(repeat):
+        tables = [Table(num_ai_players=num_players, num_cards=num_cards, \
+                        dis=num_cards // 4, verbose=0, \
+                        rng=random.Random("{}:{}".format(seed, game))) \
+                  for game in range(games)]
+        start = time.perf_counter()
+        for mytable in tables:
+            mytable.play()
+        elapsed = time.perf_counter() - start
+        decisions = sum(len(player.token_history) - 1 \
+                        for mytable in tables for player in mytable.players)
+        if best is None or elapsed / decisions < best:
+            best = elapsed / decisions
+    return 1e6 * best
+
+
+def setup_cost(reuse, games=2000, repeat=3, seed=0):
+    """
+    Time per game, in microseconds, to set a 3-player table up for a new
+    game: a new Table, or reset() of one table (reuse). Games are not
+    played, so the table is not cleared of cards.
+    """
+    mytable = Table(num_ai_players=3, verbose=0, rng=random.Random(seed))
+    rngs = [random.Random("{}:{}".format(seed, game)) for game in range(games)]
+
+    def setup():
+        if reuse:
+            for rng in rngs:
+                mytable.reset(rng=rng)
+        else:
+            for rng in rngs:
+                Table(num_ai_players=3, verbose=0, rng=rng)
+    return 1e6 * min(timeit.Timer(setup).repeat(repeat=repeat, number=1)) \
+        / games
+
+
+def setup_memory(reuse, games=1000, seed=0):
+    """
+    Memory allocated per game, in bytes, by setting a 3-player table up
+    (see setup_cost()) and playing the game: the peak traced above what
+    was held before the setup, averaged over games.
+    """
+    mytable = Table(num_ai_players=3, verbose=0, rng=random.Random(seed))
+    mytable.play()
+    total = 0
+    tracemalloc.start()
+    for game in range(games):
+        rng = random.Random("{}:{}".format(seed, game))
+        before = tracemalloc.get_traced_memory()[0]
+        tracemalloc.reset_peak()
+        if reuse:
+            mytable.reset(rng=rng)
+        else:
+            mytable = Table(num_ai_players=3, verbose=0, rng=rng)
+        mytable.play()
+        total += tracemalloc.get_traced_memory()[1] - before
+        del rng
+    tracemalloc.stop()
+    return total / games
+
+
+def midgame_table(seed=0, decisions=30):
+    """A 3-player table some way into a game."""
+    mytable = Table(num_ai_players=3, verbose=0, rng=random.Random(seed))
+    for i in range(decisions):
+        mytable.step()
+    return mytable
+
+
+def deck_shuffle(number, repeat, seed=0):
+    deck = Deck(rng=random.Random(seed))
+    return best_time(deck.shuffle, number, repeat)
+
+
+def deck_draw(number, repeat, seed=0):
+    deck = Deck(rng=random.Random(seed))
+    start = deck.top
+
+    def draw():
+        # Rewind the cursor instead of rebuilding the deck once it is empty.
+        if not deck.draw():
+            deck.top = start
+    return best_time(draw, number, repeat)
+
+
+def player_get_score(number, repeat, seed=0):
+    rng = random.Random(seed)
+    player = Player(0)
+    for card in rng.sample(range(3, 36), 10):
+        player.take_card(card, 0)
+    return best_time(player.get_score, number, repeat)
+
+
+def table_get_effective_value(number, repeat, seed=0):
+    return best_time(midgame_table(seed).get_effective_value, number, repeat)
+
+
+def table_other_player_cards(number, repeat, seed=0):
+    return best_time(midgame_table(seed).other_player_cards, number, repeat)
+
+
+def table_score(number, repeat, seed=0):
+    mytable = Table(num_ai_players=3, verbose=0, rng=random.Random(seed))
+    mytable.play()
+    return best_time(mytable.score, number, repeat)
+
+
+def peak_memory(games=10000, num_players=3, seed=0):
+    """
+    Peak memory traced while playing games games and keeping their
+    Table.score() results, as a tournament does, in KiB.
+    """
+    tracemalloc.start()
+    results = []
+    for game in range(games):
+        mytable = Table(num_ai_players=num_players, verbose=0, \
+                        rng=random.Random("{}:{}".format(seed, game)))
+        mytable.play()
+        results.append(mytable.score())
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return peak / 1024.0
+
+
+# (players, cards) of turn_cost(): per-decision cost should stay flat.
+SCALING = tuple((num_players, num_cards) for num_players in (3, 6, 12) \
+                for num_cards in (33, 100, 200))
+
+# (name, function, unit, better, number of calls per timing run)
+MICRO = (
+    ('deck_shuffle', deck_shuffle, 'us', 'lower', 20000),
+    ('deck_draw', deck_draw, 'us', 'lower', 200000),
+    ('player_get_score', player_get_score, 'us', 'lower', 100000),
+    ('table_get_effective_value', table_get_effective_value, 'us', \
+     'lower', 100000),
+    ('table_other_player_cards', table_other_player_cards, 'us', \
+     'lower', 100000),
+    ('table_score', table_score, 'us', 'lower', 20000),
+)
+
+
+def run(quick=False, seed=0):
+    """
+    Run every benchmark.
+
+    Args:
+      quick (bool): a tenth of the work, for a fast smoke run (noisier)
+      seed: seed of every benchmark
+
+    Returns:
+      dict: benchmark name -> {'value', 'unit', 'better'}
+    """
+    scale = 10 if quick else 1
+    repeat = 3 if quick else 5
+    results = {}
+    for num_players in (3, 4, 5):
+        results['games_per_sec_{}p'.format(num_players)] = {
+            'value': games_per_sec(num_players, 2000 // scale, repeat, seed),
+            'unit': 'games/s', 'better': 'higher'}
+    for num_players, num_cards in SCALING:
+        name = 'turn_{}p_{}c'.format(num_players, num_cards)
+        results[name] = {'value': turn_cost(num_players, num_cards, \
+                                            300 // scale, repeat, seed), \
+                         'unit': 'us', 'better': 'lower'}
+    for name, func, unit, better, number in MICRO:
+        results[name] = {'value': func(number // scale, repeat, seed), \
+                         'unit': unit, 'better': better}
+    for reuse, name in ((False, 'table_new'), (True, 'table_reset')):
+        results[name + '_setup'] = {
+            'value': setup_cost(reuse, 2000 // scale, repeat, seed), \
+            'unit': 'us', 'better': 'lower'}
+        results[name + '_bytes'] = {
+            'value': setup_memory(reuse, 1000 // scale, seed), \
+            'unit': 'B', 'better': 'lower'}
+    games = 10000 // scale
+    results['peak_memory_per_10k_games'] = {
+        'value': peak_memory(games, seed=seed) * 10000 / games, \
+        'unit': 'KiB', 'better': 'lower'}
+    return results
+
+
+def metadata():
+    try:
+        commit = subprocess.check_output(['git', 'rev-parse', 'HEAD'], \
+                                         stderr=subprocess.DEVNULL)\
+                           .decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return {'commit': commit, 'python': platform.python_version(), \
+            'machine': platform.machine(), \
+            'time': time.strftime('%Y-%m-%dT%H:%M:%S')}
+
+
+def compare(results, baseline, threshold):
+    """
+    Compare results with a baseline run.
+
+    Returns:
+      list of (name, old value, new value, relative change, regressed),
+      where a positive change is an improvement
+    """
+    rows = []
+    for name, new in results.items():
+        if name not in baseline:
+            continue
+        old = baseline[name]['value']
+        change = (new['value'] - old) / old if old else 0.0
+        if new['better'] == 'lower':
+            change = -change
+        rows.append((name, old, new['value'], change, change < -threshold))
+    return rows
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the simulator")
+    parser.add_argument('-o', '--output', help="write results as JSON")
+    parser.add_argument('-c', '--compare', metavar='JSON', \
+                        help="results of an earlier run to compare with")
+    parser.add_argument('-t', '--threshold', type=float, default=0.1, \
+                        help="fraction by which a benchmark may get worse "
+                             "before it counts as a regression (default 0.1)")
+    parser.add_argument('-q', '--quick', action='store_true', \
+                        help="a tenth of the work (noisier)")
+    parser.add_argument('-s', '--seed', default='0')
+    args = parser.parse_args(argv)
+
+    results = run(args.quick, args.seed)
+    print('{0:28}  {1:>12}  {2}'.format('Benchmark', 'Value', 'Unit'))
+    for name, result in results.items():
+        print('{0:28}  {1:12.2f}  {2}'\
+              .format(name, result['value'], result['unit']))
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump({'meta': metadata(), 'results': results}, f, indent=2)
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)['results']
+        regressions = 0
+        print('\n{0:28}  {1:>12}  {2:>12}  {3:>8}'\
+              .format('Benchmark', 'Before', 'After', 'Change'))
+        for name, old, new, change, regressed in \
+                compare(results, baseline, args.threshold):
+            print('{0:28}  {1:12.2f}  {2:12.2f}  {3:+7.1%}{4}'\
+                  .format(name, old, new, change, \
+                          '  REGRESSION' if regressed else ''))
+            regressions += regressed
+        if regressions:
+            print("\n{} benchmark(s) regressed by more than {:.0%}"\
+                  .format(regressions, args.threshold))
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
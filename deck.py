@@ -1,59 +1,105 @@
-import sys
 import random
-from random import randint
 
 class Deck(object):
     """A deck of cards.
 
+    The cards are kept in an array in draw order, with a cursor marking the
+    top of the deck, so drawing and discarding never move the other cards.
+
     Attributes:
-      cards (List[int])
+      order (List[int]): all cards of the setup deck, in draw order
+      top (int): index in order of the next card to draw
+      cards (List[int]): cards remaining in the deck (a copy)
       min_card (int)
       max_card (int)
       tot_orig_cards (int)
       tot_cards (int)
 
     Methods:
+      reset()
       shuffle()
       discard()
       draw()
     """
 
-    def __init__(self, num=33, offset=3, dis=9):
+    def __init__(self, num=33, offset=3, dis=9, rng=None, order=None):
         """
         Args::
           num (int): number of cards in initial setup (default 33)
           offset (int): lowest numbered card (default 3)
           dis (int): number of cards to discard in setup (default 9)
+          rng (random.Random): source of randomness for shuffling
+                  (default: the global random module)
+          order (List[int]): an already shuffled setup deck (see DeckPool);
+                  the deck is not shuffled again
+
+        Raises:
+          ValueError: if the arguments do not make a playable deck
 
         Note:
           Defaults are official game values: cards are numbered from 3 to 35,
-          i.e. 33 cards with an offset of 3, 9 of which are discarded 
+          i.e. 33 cards with an offset of 3, 9 of which are discarded
           (giving a final deck of 24 cards).
         """
         if num < 1:
-            sys.exit("Cannot initialize Deck with less than 1 card!")
+            raise ValueError("Cannot initialize Deck with less than 1 card!")
         if offset < 1:
-            sys.exit("A positive offset value is required")
-        if num <= dis:
-            sys.exit("Discarding all the cards...")
+            raise ValueError("A positive offset value is required")
+        if num <= dis or dis < 0:
+            raise ValueError("Cannot discard {} of {} cards".format(dis, num))
+        self.rng = random if rng is None else rng
         self.min_card = offset
         self.max_card = num + offset - 1
         self.tot_orig_cards = num
         self.tot_cards = num - dis
-        self.cards = []
-        for i in range(num):
-            self.cards.append(i + offset)
-        self.shuffle()
-        self.discard(dis)
+        self.order = [0] * num
+        self.reset(order=order)
+
+    def reset(self, rng=None, order=None):
+        """
+        Set the deck up again for a new game, in place: the order array is
+        reused, so a table playing game after game keeps the same deck.
+
+        Args:
+          rng (random.Random): new source of randomness for shuffling
+                  (default: keep the current one)
+          order (List[int]): an already shuffled setup deck, as for
+                  __init__()
+
+        With the same rng state, the deck is shuffled exactly as a new Deck
+        would be.
+        """
+        if rng is not None:
+            self.rng = rng
+        self.top = 0
+        if order is None:
+            self.order[:] = range(self.min_card, self.max_card + 1)
+            self.shuffle()
+        else:
+            if len(order) != self.tot_orig_cards:
+                raise ValueError("Shuffled deck must have {} cards"\
+                                 .format(self.tot_orig_cards))
+            self.order[:] = order
+        self.discard(self.tot_orig_cards - self.tot_cards)
+
+    def __len__(self):
+        """Number of cards remaining in the deck."""
+        return len(self.order) - self.top
+
+    @property
+    def cards(self):
+        """Cards remaining in the deck, in draw order (a copy)."""
+        return self.order[self.top:]
 
     def shuffle(self):
-        """Randomize the order of cards in the deck."""
-        shuffled = []
-        while len(self.cards) > 0:
-            j = random.choice(self.cards)
-            self.cards.remove(j)
-            shuffled.append(j)
-        self.cards = shuffled
+        """Randomize the order of the cards remaining in the deck, in place
+        (Fisher-Yates)."""
+        order = self.order
+        top = self.top
+        randrange = self.rng.randrange
+        for i in range(len(order) - 1, top, -1):
+            j = randrange(top, i + 1)
+            order[i], order[j] = order[j], order[i]
 
     def discard(self, begone=1):
         """Remove a number of cards from the deck.
@@ -61,11 +107,9 @@ class Deck(object):
         Args:
             begone (int):  number of cards to discard
         """
-        if begone < 0 or begone > len(self.cards):
-            sys.exit("Cannot discard", begone, "cards!")
-        while begone > 0:
-            self.cards.pop(0)
-            begone -= 1
+        if begone < 0 or begone > len(self):
+            raise ValueError("Cannot discard {} cards!".format(begone))
+        self.top += begone
 
     def draw(self):
         """Remove a card from the deck and return its value.
@@ -73,9 +117,51 @@ class Deck(object):
         Returns:
             int: value of card, or 0 if no cards in deck
         """
-        try:
-            card = self.cards.pop(0)
+        if self.top < len(self.order):
+            card = self.order[self.top]
+            self.top += 1
             return card
-        except IndexError:
-            return 0
+        return 0
+
+
+class DeckPool(object):
+    """A supply of pre-shuffled decks, generated in bulk.
+
+    Shuffling is done for a whole block of decks at once as a 2-D NumPy
+    permutation, so building a Deck for a new Table costs only a row copy.
+
+    Methods:
+      deck()
+    """
+
+    def __init__(self, block=10000, num=33, offset=3, dis=9, rng=None):
+        """
+        Args:
+          block (int): number of decks shuffled at a time
+          num, offset, dis: as for Deck
+          rng (numpy.random.Generator or int): random generator, or a seed
+                  for a new one
+        """
+        import numpy as np
+        if not isinstance(rng, np.random.Generator):
+            rng = np.random.default_rng(rng)
+        self.rng = rng
+        self.block = block
+        self.num = num
+        self.offset = offset
+        self.dis = dis
+        self.cards = np.arange(offset, offset + num)
+        self.decks = []
+
+    def refill(self):
+        """Shuffle a new block of decks."""
+        decks = self.rng.permuted(
+            self.cards[None, :].repeat(self.block, axis=0), axis=1)
+        # Reversed so that deck() can pop rows off the end in block order.
+        self.decks = decks.tolist()[::-1]
 
+    def deck(self):
+        """Return the next pre-shuffled Deck."""
+        if not self.decks:
+            self.refill()
+        return Deck(self.num, self.offset, self.dis, order=self.decks.pop())
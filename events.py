@@ -0,0 +1,205 @@
+from collections import namedtuple
+from stats import Counter
+
+# Events sent by an instrumented Table to its subscribers. pos is the
+# position of the player concerned.
+GameStarted = namedtuple('GameStarted', 'deck players card_up')
+CardDrawn = namedtuple('CardDrawn', 'card remaining')
+EffectiveValue = namedtuple('EffectiveValue', 'pos card value')
+Decision = namedtuple('Decision', 'pos card pot tokens branch take')
+Pass = namedtuple('Pass', 'pos card pot tokens cards')
+Take = namedtuple('Take', 'pos card pot tokens cards')
+MilkDecision = namedtuple('MilkDecision', 'pos card milk')
+SpiteTake = namedtuple('SpiteTake', 'pos card')
+GameOver = namedtuple('GameOver', 'turns')
+
+# Decision.branch when the player is out of tokens and must take.
+NO_TOKENS = 'no_tokens'
+
+
+def instrument(table):
+    """
+    Make table send events to table.subscribers.
+
+    Called by Table.__init__ and Table.reset(), and only if there are
+    subscribers: the start(), decide(), player_passes(),
+    player_takes_card(), milking_potential() and vindictive_potential() of
+    this one table are replaced by versions that report what they do, so
+    an uninstrumented Table runs no event code at all.
+
+    Nothing is sent while the table is set up: the game is announced
+    (GameStarted, then CardDrawn) by its first move, or by an explicit
+    start().
+    """
+    subscribers = table.subscribers
+    if len(subscribers) == 1:
+        emit = subscribers[0]
+    else:
+        def emit(event):
+            for subscriber in subscribers:
+                subscriber(event)
+    cls = type(table)
+    turns = [0]
+    started = [False]
+
+    def start():
+        if not started[0]:
+            started[0] = True
+            emit(GameStarted([table.card_up] + table.deck.cards, \
+                             table.players, table.card_up))
+            emit(CardDrawn(table.card_up, len(table.deck)))
+
+    def decide(player):
+        start()
+        turn = table.whose_turn
+        emit(EffectiveValue(turn, table.card_up, player.eff_val))
+        tokens = player.tokens
+        if tokens == 0:
+            take, branch = True, NO_TOKENS
+        else:
+            take, branch = player.explain(table)
+        turns[0] += 1
+        emit(Decision(turn, table.card_up, table.pot, tokens, branch, take))
+        return take
+
+    def player_passes():
+        start()
+        turn = table.whose_turn
+        card, pot = table.card_up, table.pot
+        cls.player_passes(table)
+        player = table.players[turn]
+        emit(Pass(turn, card, pot + 1, player.tokens, sorted(player.cards)))
+
+    def player_takes_card():
+        start()
+        turn = table.whose_turn
+        card, pot = table.card_up, table.pot
+        cls.player_takes_card(table)
+        player = table.players[turn]
+        emit(Take(turn, card, pot, player.tokens, sorted(player.cards)))
+        if table.card_up:
+            emit(CardDrawn(table.card_up, len(table.deck)))
+        else:
+            emit(GameOver(turns[0]))
+
+    def milking_potential():
+        milk = cls.milking_potential(table)
+        emit(MilkDecision(table.whose_turn, table.card_up, bool(milk)))
+        return milk
+
+    def vindictive_potential():
+        spite = cls.vindictive_potential(table)
+        if spite:
+            emit(SpiteTake(table.whose_turn, table.card_up))
+        return spite
+
+    table.start = start
+    table.decide = decide
+    table.player_passes = player_passes
+    table.player_takes_card = player_takes_card
+    table.milking_potential = milking_potential
+    table.vindictive_potential = vindictive_potential
+
+
+class DecisionCounter(object):
+    """Subscriber counting decisions, by branch, and turns per game.
+
+    One instance can follow any number of tables; instances from different
+    processes combine with merge().
+
+    Attributes:
+      branches (Counter): decisions per Decision.branch
+      takes (Counter): decisions to take, per branch
+      turns (Counter): games per number of decisions made in the game
+      milks (int): times a player chose to milk
+      spites (int): cards taken out of spite
+    """
+
+    def __init__(self):
+        self.branches = Counter()
+        self.takes = Counter()
+        self.turns = Counter()
+        self.milks = 0
+        self.spites = 0
+
+    def __call__(self, event):
+        kind = type(event)
+        if kind is Decision:
+            self.branches.add(event.branch)
+            if event.take:
+                self.takes.add(event.branch)
+        elif kind is GameOver:
+            self.turns.add(event.turns)
+        elif kind is MilkDecision:
+            self.milks += event.milk
+        elif kind is SpiteTake:
+            self.spites += 1
+
+    def merge(self, other):
+        self.branches.merge(other.branches)
+        self.takes.merge(other.takes)
+        self.turns.merge(other.turns)
+        self.milks += other.milks
+        self.spites += other.spites
+        return self
+
+
+# Commentary on decisions, for TextPrinter at verbose=2.
+BRANCH_TEXT = {
+    NO_TOKENS: "  Player {pos}: No tokens left",
+    'for_pot': "  Player {pos} takes it for the pot. (tokens = {tokens}, "
+               "pot = {pot})",
+    'first_card': "  Player {pos}: Card within initial threshold value",
+    'low_value': "  Player {pos}: effective value < 1",
+    'milk': "  Player {pos}: effective value < 1",
+    'below_threshold': "  Player {pos}: effective value below threshold",
+}
+
+
+class TextPrinter(object):
+    """Subscriber printing a game for a person to read.
+
+    This is what Table's verbose option prints: moves at verbose=1, and the
+    reasons for them as well at verbose=2.
+    """
+
+    def __init__(self, verbose=1):
+        self.verbose = verbose
+
+    def __call__(self, event):
+        kind = type(event)
+        if kind is Pass:
+            print("Player", event.pos + 1, event.cards, "plays token, has", \
+                  event.tokens, "remaining")
+        elif kind is Take:
+            cards = list(event.cards)
+            cards.remove(event.card)
+            print("Player", event.pos + 1, cards, "takes card:", event.card)
+        elif kind is CardDrawn:
+            print("Card up:", event.card)
+        elif kind is GameOver:
+            print("Game Over\n")
+        elif kind is GameStarted:
+            for player in event.players:
+                print("Player", player.pos + 1, "at position", player.pos, \
+                      "with init_threshold:", player.init_threshold, \
+                      "and token_threshold:", player.token_threshold, \
+                      "and eff_val_threshold:", player.eff_val_threshold, \
+                      "and pot_threshold:", player.pot_threshold)
+            print("\nInitial deck:", event.deck)
+        elif self.verbose < 2:
+            return
+        elif kind is Decision:
+            text = BRANCH_TEXT.get(event.branch)
+            if text:
+                print(text.format(pos=event.pos + 1, tokens=event.tokens, \
+                                  pot=event.pot))
+        elif kind is EffectiveValue and event.value != int(event.value):
+            # The expected value of a card that may complete a run.
+            print("  Player {0}: effective value = {1:.2f}"\
+                  .format(event.pos + 1, event.value))
+        elif kind is MilkDecision:
+            print("  Player {}: {}".format(event.pos + 1, \
+                  "milking" if event.milk else "not milking"))
+        elif kind is SpiteTake:
+            print("  player takes card out of spite")
@@ -0,0 +1,337 @@
+import os
+import numpy as np
+from multiprocessing import Pool
+from table import Table
+from tournament import game_rng, tasks_for
+
+# Model inputs, one row per player per game.
+FEATURES = (
+    'init_threshold',
+    'eff_val_threshold',
+    'token_threshold',
+    'pot_threshold',
+    'pos',
+    'min_tokens',           # fewest tokens held during the game
+    'max_tokens',           # most tokens held during the game
+    'passes_before_take',   # passes before the player's first take
+    'num_runs',             # runs in the final hand
+)
+# Model targets, after the features in every row.
+TARGETS = (
+    'score',
+    'win',                  # win code, as in Table.score()
+)
+COLUMNS = FEATURES + TARGETS
+
+
+def game_rows(table):
+    """The rows of a finished game, as tuples in COLUMNS order."""
+    players = table.players
+    scores = [player.get_score() for player in players]
+    low = min(scores)
+    winners = scores.count(low)
+    rows = []
+    for player, score in zip(players, scores):
+        history = player.token_history
+        passes = 0
+        while passes + 1 < len(history) \
+              and history[passes + 1] < history[passes]:
+            passes += 1
+        rows.append((player.init_threshold, player.eff_val_threshold, \
+                     player.token_threshold, player.pot_threshold, \
+                     player.pos, min(history), max(history), passes, \
+                     player.num_runs, score, \
+                     0 if score != low else 1 if winners == 1 else 2))
+    return rows
+
+
+def feature_block(task):
+    """
+    Play a block of tournament games (see tournament.play_games()) and
+    return only their feature rows.
+
+    Returns:
+      ndarray[float32]: shape (games * players, len(COLUMNS))
+    """
+    seed, start, stop, table_args = task
+    rows = []
+    mytable = Table(verbose=0, rng=game_rng(seed, start), **table_args)
+    for game in range(start, stop):
+        if game > start:
+            mytable.reset(rng=game_rng(seed, game))
+        mytable.play()
+        rows += game_rows(mytable)
+    # One conversion per block: far cheaper than filling rows one by one.
+    return np.array(rows, dtype=np.float32).reshape(-1, len(COLUMNS))
+
+
+class FeatureWriter(object):
+    """Streams feature rows to disk as fixed-size float32 .npy blocks.
+
+    Rows are copied into one preallocated block; each full block is saved
+    as the next numbered file in the output directory and the buffer is
+    reused. Blocks are read back memory-mapped with iter_blocks().
+
+    Methods:
+      add()
+      add_rows()
+      flush()
+      close()
+    """
+
+    def __init__(self, path, block=1 << 20):
+        """
+        Args:
+          path (str): output directory
+          block (int): rows per block on disk
+        """
+        os.makedirs(path, exist_ok=True)
+        self.path = path
+        self.buffer = np.empty((block, len(COLUMNS)), dtype=np.float32)
+        self.rows = 0
+        self.num_blocks = len([entry for entry in os.listdir(path) \
+                               if entry.endswith('.npy')])
+
+    def add(self, table):
+        """Append the rows of a finished game."""
+        self.add_rows(np.array(game_rows(table), dtype=np.float32))
+
+    def add_rows(self, rows):
+        """Append rows, e.g. from feature_block()."""
+        while len(rows):
+            n = min(len(rows), len(self.buffer) - self.rows)
+            self.buffer[self.rows:self.rows + n] = rows[:n]
+            self.rows += n
+            rows = rows[n:]
+            if self.rows == len(self.buffer):
+                self.flush()
+
+    def flush(self):
+        """Write the buffered rows as a new block."""
+        if self.rows == 0:
+            return
+        np.save(os.path.join(self.path, '{:06d}.npy'.format(self.num_blocks)), \
+                self.buffer[:self.rows])
+        self.num_blocks += 1
+        self.rows = 0
+
+    def close(self):
+        self.flush()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def write_features(path, num_games, num_players=3, seed=0, workers=None, \
+                   chunk=None, block=1 << 20, **table_args):
+    """
+    Play a tournament (see tournament.iter_tournament()) on a process pool,
+    writing only the feature rows of every game to path.
+
+    Returns:
+      int: rows written
+    """
+    if workers is None:
+        workers = os.cpu_count() or 1
+    table_args['num_ai_players'] = num_players
+    tasks = tasks_for(num_games, seed, workers, chunk, table_args)
+    rows = 0
+    with FeatureWriter(path, block) as writer:
+        if workers == 1:
+            blocks = map(feature_block, tasks)
+        else:
+            pool = Pool(workers)
+            blocks = pool.imap(feature_block, tasks)
+        try:
+            for rows_block in blocks:
+                writer.add_rows(rows_block)
+                rows += len(rows_block)
+        finally:
+            if workers > 1:
+                pool.close()
+                pool.join()
+    return rows
+
+
+def iter_blocks(path):
+    """Yield the blocks written by FeatureWriter, in order, memory-mapped."""
+    for entry in sorted(os.listdir(path)):
+        if entry.endswith('.npy'):
+            yield np.load(os.path.join(path, entry), mmap_mode='r')
+
+
+def design(X):
+    """X with a leading column of ones, in float64."""
+    out = np.empty((len(X), X.shape[1] + 1))
+    out[:, 0] = 1.0
+    out[:, 1:] = X
+    return out
+
+
+class LinearModel(object):
+    """Least-squares linear regression, fitted incrementally.
+
+    partial_fit() only accumulates X'X and X'y, so the fit is exact, in one
+    pass, whatever the number of chunks, and memory does not depend on the
+    number of rows.
+
+    Attributes:
+      coef (ndarray): intercept, then one coefficient per feature
+
+    Methods:
+      partial_fit()
+      fit()
+      predict()
+    """
+
+    def __init__(self, ridge=1e-6):
+        self.ridge = ridge
+        self.xtx = None
+        self.xty = None
+        self.n = 0
+        self.coef = None
+
+    def partial_fit(self, X, y):
+        A = design(X)
+        if self.xtx is None:
+            self.xtx = np.zeros((A.shape[1], A.shape[1]))
+            self.xty = np.zeros(A.shape[1])
+        self.xtx += A.T @ A
+        self.xty += A.T @ y
+        self.n += len(y)
+        return self
+
+    def fit(self):
+        """Solve the normal equations for the rows seen so far."""
+        penalty = self.ridge * self.n * np.eye(len(self.xty))
+        penalty[0, 0] = 0.0
+        self.coef = np.linalg.solve(self.xtx + penalty, self.xty)
+        return self
+
+    def predict(self, X):
+        if self.coef is None:
+            self.fit()
+        return design(X) @ self.coef
+
+
+class LogisticModel(object):
+    """Logistic regression trained by mini-batch gradient descent (Adam).
+
+    Features are standardized with the mean and standard deviation of the
+    first chunk passed to partial_fit(), which stay fixed afterwards.
+
+    Attributes:
+      coef (ndarray): intercept, then one coefficient per standardized
+              feature
+
+    Methods:
+      partial_fit()
+      predict_proba()
+    """
+
+    def __init__(self, batch=1024, rate=0.02, l2=1e-6):
+        self.batch = batch
+        self.rate = rate
+        self.l2 = l2
+        self.mean = None
+        self.scale = None
+        self.coef = None
+        self.steps = 0
+
+    def standardize(self, X):
+        return design((X - self.mean) / self.scale)
+
+    def partial_fit(self, X, y):
+        if self.mean is None:
+            self.mean = X.mean(axis=0, dtype=np.float64)
+            self.scale = X.std(axis=0, dtype=np.float64)
+            self.scale[self.scale == 0] = 1.0
+            self.coef = np.zeros(X.shape[1] + 1)
+            self.m = np.zeros_like(self.coef)
+            self.v = np.zeros_like(self.coef)
+        for start in range(0, len(y), self.batch):
+            A = self.standardize(X[start:start + self.batch])
+            target = y[start:start + self.batch]
+            p = 1.0 / (1.0 + np.exp(-(A @ self.coef)))
+            grad = A.T @ (p - target) / len(target) + self.l2 * self.coef
+            # Adam
+            self.steps += 1
+            self.m = 0.9 * self.m + 0.1 * grad
+            self.v = 0.999 * self.v + 0.001 * grad * grad
+            m = self.m / (1 - 0.9 ** self.steps)
+            v = self.v / (1 - 0.999 ** self.steps)
+            self.coef -= self.rate * m / (np.sqrt(v) + 1e-8)
+        return self
+
+    def predict_proba(self, X):
+        """Probability of winning (or tying for the win)."""
+        return 1.0 / (1.0 + np.exp(-(self.standardize(X) @ self.coef)))
+
+
+def split(block):
+    """Features, score and win (1 if won or tied) of a block."""
+    X = np.asarray(block[:, :len(FEATURES)])
+    score = np.asarray(block[:, len(FEATURES)], dtype=np.float64)
+    win = (np.asarray(block[:, len(FEATURES) + 1]) > 0).astype(np.float64)
+    return X, score, win
+
+
+def train(path, epochs=1, holdout=1, chunk=1 << 20, batch=1024):
+    """
+    Fit a score model and a win-probability model on the blocks in path,
+    chunk rows at a time, so memory does not depend on the number of games.
+
+    Args:
+      epochs (int): passes of the win model over the data (the score model
+              is exact after one)
+      holdout (int): last blocks kept out of training for evaluation
+      chunk (int): rows read at a time
+      batch (int): mini-batch size of the win model
+
+    Returns:
+      tuple: (LinearModel, LogisticModel, dict of evaluation metrics on the
+             held-out blocks, or None without any)
+
+    Raises:
+      ValueError: if path holds no blocks
+    """
+    blocks = list(iter_blocks(path))
+    if not blocks:
+        raise ValueError("No feature blocks in {}".format(path))
+    if holdout >= len(blocks):
+        holdout = 0
+    training = blocks[:len(blocks) - holdout]
+    testing = blocks[len(blocks) - holdout:]
+    score_model = LinearModel()
+    win_model = LogisticModel(batch)
+    for epoch in range(epochs):
+        for block in training:
+            for start in range(0, len(block), chunk):
+                X, score, win = split(block[start:start + chunk])
+                if epoch == 0:
+                    score_model.partial_fit(X, score)
+                win_model.partial_fit(X, win)
+    score_model.fit()
+    if not testing:
+        return score_model, win_model, None
+    sq_err = sq_dev = log_loss = correct = n = 0.0
+    score_sum = 0.0
+    for block in testing:
+        for start in range(0, len(block), chunk):
+            X, score, win = split(block[start:start + chunk])
+            error = score_model.predict(X) - score
+            sq_err += error @ error
+            score_sum += score.sum()
+            sq_dev += score @ score
+            p = np.clip(win_model.predict_proba(X), 1e-12, 1 - 1e-12)
+            log_loss -= (win * np.log(p) + (1 - win) * np.log(1 - p)).sum()
+            correct += ((p > 0.5) == (win > 0)).sum()
+            n += len(score)
+    variance = sq_dev - score_sum * score_sum / n
+    metrics = {'rows': int(n), 'score_rmse': np.sqrt(sq_err / n), \
+               'score_r2': 1 - sq_err / variance, \
+               'win_log_loss': log_loss / n, 'win_accuracy': correct / n}
+    return score_model, win_model, metrics
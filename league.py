@@ -0,0 +1,333 @@
+import os
+import ast
+import json
+import math
+import random
+from multiprocessing import Pool
+from table import Table
+from paired import make_player
+from tournament import game_rng
+
+# Weng-Lin defaults, on the TrueSkill scale.
+MU = 25.0
+SIGMA = MU / 3
+BETA = SIGMA / 2
+KAPPA = 1e-4
+ELO = 1500.0
+# Matches per batch. Fixed, so that the schedule, and the ratings, are the
+# same whatever the number of workers.
+BATCH = 32
+
+
+class Rating(object):
+    """Rating of one league entry.
+
+    Attributes:
+      mu (float): estimated skill
+      sigma (float): uncertainty of mu
+      elo (float): multiplayer Elo rating, kept alongside for comparison
+      games (int): games rated
+    """
+
+    def __init__(self, mu=MU, sigma=SIGMA, elo=ELO, games=0):
+        self.mu = mu
+        self.sigma = sigma
+        self.elo = elo
+        self.games = games
+
+    @property
+    def conservative(self):
+        """mu - 3 sigma: the leaderboard sort key."""
+        return self.mu - 3 * self.sigma
+
+
+def ranks_from_wins(wins):
+    """
+    Finishing ranks from Table.score() win codes: winners (1) and tied
+    winners (2) share rank 0, everybody else rank 1.
+    """
+    return [0 if win else 1 for win in wins]
+
+
+def rate(ratings, ranks, beta=BETA, kappa=KAPPA):
+    """
+    Update the mu and sigma of ratings in place from one game (Weng-Lin
+    Bayesian approximation, Bradley-Terry full pairing, a closed-form
+    counterpart of TrueSkill for any number of players).
+
+    Args:
+      ratings (List[Rating]): the players of the game
+      ranks (List[int]): finishing rank of each (lower is better, equal
+              ranks tie)
+    """
+    updates = []
+    for i, rating in enumerate(ratings):
+        var = rating.sigma ** 2
+        omega = 0.0
+        delta = 0.0
+        for q, other in enumerate(ratings):
+            if q == i:
+                continue
+            c = math.sqrt(var + other.sigma ** 2 + 2 * beta ** 2)
+            p = 1.0 / (1.0 + math.exp((other.mu - rating.mu) / c))
+            s = 1.0 if ranks[i] < ranks[q] \
+                else 0.5 if ranks[i] == ranks[q] else 0.0
+            omega += var / c * (s - p)
+            delta += (rating.sigma / c) * var / c ** 2 * p * (1.0 - p)
+        updates.append((omega, max(1.0 - delta, kappa)))
+    for rating, (omega, shrink) in zip(ratings, updates):
+        rating.mu += omega
+        rating.sigma *= math.sqrt(shrink)
+        rating.games += 1
+
+
+def update_elo(ratings, ranks, k=16.0):
+    """
+    Update the elo of ratings in place from one game, as a pairwise Elo
+    match against each other player, scaled by 1 / (players - 1).
+    """
+    changes = []
+    for i, rating in enumerate(ratings):
+        change = 0.0
+        for q, other in enumerate(ratings):
+            if q == i:
+                continue
+            expected = 1.0 / (1.0 + 10 ** ((other.elo - rating.elo) / 400.0))
+            s = 1.0 if ranks[i] < ranks[q] \
+                else 0.5 if ranks[i] == ranks[q] else 0.0
+            change += s - expected
+        changes.append(k * change / max(1, len(ratings) - 1))
+    for rating, change in zip(ratings, changes):
+        rating.elo += change
+
+
+def play_match(task):
+    """
+    Play one match: the same deal once per seat rotation of the entries.
+
+    Args:
+      task (tuple): (seed, match index, candidates of the entries (see
+              paired.make_player()), Table keyword args)
+
+    Returns:
+      list: for each game, (index of the entry in each seat, win codes)
+    """
+    seed, match, specs, table_args = task
+    results = []
+    num_players = len(specs)
+    mytable = None
+    for shift in range(num_players):
+        order = [(seat + shift) % num_players for seat in range(num_players)]
+        players = [make_player(specs[i], pos) for pos, i in enumerate(order)]
+        if mytable is None:
+            mytable = Table(players=players, num_ai_players=0, verbose=0, \
+                            rng=game_rng(seed, match), **table_args)
+        else:
+            mytable.reset(players=players, rng=game_rng(seed, match))
+        mytable.play()
+        results.append((order, [features[0] \
+                                for features in mytable.score()]))
+    return results
+
+
+class League(object):
+    """A population of strategies, rated as they play each other.
+
+    Ratings are updated game by game (see rate() and update_elo()).
+    Matches are scheduled where they tell the most: each table is built
+    around the entry with the most uncertain rating, with opponents whose
+    ratings are uncertain and close to it, instead of going round-robin.
+    A batch of matches is played on a worker pool between updates, and the
+    league can be checkpointed after each batch and resumed, with entries
+    added at any time.
+
+    Attributes:
+      names (List[str]): entries, in the order they joined
+      specs (dict): candidate of each entry: thresholds, or a picklable
+              callable returning a Player for a given pos
+      ratings (dict): Rating of each entry
+      matches (int): matches played
+      games (int): games played
+
+    Methods:
+      add()
+      schedule()
+      play()
+      run()
+      leaderboard()
+      save()
+      load()
+    """
+
+    def __init__(self, entries=None, num_players=3, seed=0, workers=None, \
+                 checkpoint=None, **table_args):
+        """
+        Args:
+          entries: (name, candidate) pairs, or a dict of them
+          num_players (int): players per table
+          seed: seed of the schedule and of the games
+          workers (int): worker processes (default: one per CPU)
+          checkpoint (str): JSON file to save the league to after every
+                  batch, and to resume from if it exists
+          table_args: further keyword arguments for Table (num_cards,
+                  offset, dis)
+        """
+        self.num_players = num_players
+        self.seed = seed
+        self.workers = workers or os.cpu_count() or 1
+        self.checkpoint = checkpoint
+        self.table_args = table_args
+        self.rng = random.Random("{}:league".format(seed))
+        self.names = []
+        self.specs = {}
+        self.ratings = {}
+        self.matches = 0
+        self.games = 0
+        if isinstance(entries, dict):
+            entries = entries.items()
+        for name, spec in entries or ():
+            self.add(name, spec)
+        if checkpoint and os.path.exists(checkpoint):
+            self.load(checkpoint)
+
+    def add(self, name, spec):
+        """Add an entry, with a fresh rating unless it has one."""
+        if name not in self.specs:
+            self.names.append(name)
+        self.specs[name] = spec
+        self.ratings.setdefault(name, Rating())
+
+    def schedule(self, batch):
+        """
+        Choose batch seatings (tuples of names).
+
+        Each table goes to the entry with the highest sigma, discounted by
+        the tables it already has in this batch. Its opponents are picked
+        by sigma times the chance of a close game with it, exp(-d^2 /
+        (2 c^2)) for a rating difference d. Ties are broken at random.
+        """
+        if len(self.names) < self.num_players:
+            raise ValueError("League needs at least {} entries"\
+                             .format(self.num_players))
+        pending = dict.fromkeys(self.names, 0)
+        seatings = []
+        for i in range(batch):
+            def weight(name):
+                return self.ratings[name].sigma ** 2 / (1 + pending[name])
+            anchor = max(self.names, \
+                         key=lambda name: (weight(name), self.rng.random()))
+            centre = self.ratings[anchor]
+            seating = [anchor]
+            while len(seating) < self.num_players:
+                def score(name):
+                    rating = self.ratings[name]
+                    c2 = centre.sigma ** 2 + rating.sigma ** 2 + 2 * BETA ** 2
+                    close = math.exp(-(rating.mu - centre.mu) ** 2 / (2 * c2))
+                    return (weight(name) * close, self.rng.random())
+                seating.append(max([name for name in self.names \
+                                    if name not in seating], key=score))
+            self.rng.shuffle(seating)
+            for name in seating:
+                pending[name] += 1
+            seatings.append(tuple(seating))
+        return seatings
+
+    def play(self, seatings, mapper=map):
+        """Play seatings as matches and rate every game, in order."""
+        tasks = []
+        for seating in seatings:
+            tasks.append((self.seed, self.matches, \
+                          [self.specs[name] for name in seating], \
+                          self.table_args))
+            self.matches += 1
+        for seating, results in zip(seatings, mapper(play_match, tasks)):
+            for order, wins in results:
+                ratings = [self.ratings[seating[i]] for i in order]
+                ranks = ranks_from_wins(wins)
+                rate(ratings, ranks)
+                update_elo(ratings, ranks)
+                self.games += 1
+
+    def run(self, num_games, batch=BATCH, scheduler=None):
+        """
+        Play about num_games more games, in batches.
+
+        Args:
+          batch (int): matches per batch, rated together after being
+                  played on the pool
+          scheduler: callable(league, batch) returning seatings (default
+                  League.schedule; see round_robin())
+
+        Returns:
+          League: self
+        """
+        if scheduler is None:
+            scheduler = League.schedule
+        pool = Pool(self.workers) if self.workers > 1 else None
+        mapper = pool.map if pool else map
+        target = self.games + num_games
+        try:
+            while self.games < target:
+                matches = min(batch, -(-(target - self.games) \
+                                       // self.num_players))
+                self.play(scheduler(self, matches), mapper)
+                if self.checkpoint:
+                    self.save(self.checkpoint)
+        finally:
+            if pool:
+                pool.close()
+                pool.join()
+        return self
+
+    def leaderboard(self):
+        """
+        Returns:
+          list of (name, conservative rating, mu, sigma, elo, games), best
+          first
+        """
+        board = [(name, rating.conservative, rating.mu, rating.sigma, \
+                  rating.elo, rating.games) \
+                 for name, rating in self.ratings.items() \
+                 if name in self.specs]
+        board.sort(key=lambda row: row[1], reverse=True)
+        return board
+
+    def save(self, path):
+        """Checkpoint the ratings and counters (atomically)."""
+        state = {'num_players': self.num_players, 'seed': str(self.seed), \
+                 'matches': self.matches, 'games': self.games, \
+                 'rng': repr(self.rng.getstate()), \
+                 'ratings': {name: [rating.mu, rating.sigma, rating.elo, \
+                                    rating.games] \
+                             for name, rating in self.ratings.items()}}
+        with open(path + '.tmp', 'w') as f:
+            json.dump(state, f, indent=1)
+        os.replace(path + '.tmp', path)
+
+    def load(self, path):
+        """
+        Resume from a checkpoint. Entries missing from it keep their
+        ratings; ratings of entries not (yet) added are kept for when they
+        are.
+        """
+        with open(path) as f:
+            state = json.load(f)
+        if state['num_players'] != self.num_players:
+            raise ValueError("{} is a {}-player league"\
+                             .format(path, state['num_players']))
+        self.matches = state['matches']
+        self.games = state['games']
+        self.rng.setstate(ast.literal_eval(state['rng']))
+        for name, (mu, sigma, elo, games) in state['ratings'].items():
+            self.ratings[name] = Rating(mu, sigma, elo, games)
+
+
+def round_robin(league, batch):
+    """
+    Scheduler cycling through every seating of the entries in turn, for
+    comparison with League.schedule().
+    """
+    from itertools import combinations
+    seatings = list(combinations(league.names, league.num_players))
+    return [seatings[(league.matches + i) % len(seatings)] \
+            for i in range(batch)]
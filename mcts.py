@@ -0,0 +1,413 @@
+import os
+import math
+import time
+import random
+from multiprocessing import Pool
+from player import Player
+from strategy import Strategy
+
+TAKE = -2
+PASS = -1
+
+
+class GameState(object):
+    """Compact, cheaply copied snapshot of a game.
+
+    Hands are bitmasks (see Player.hand), so copying a state copies three
+    short lists of ints. A state taken from a Table holds only what the
+    player to move can see: deck is None and the cards left to draw are
+    some remaining of the unseen cards. determinize() deals them out.
+
+    Attributes:
+      hands (List[int]): bitmask hand of each player
+      tokens (List[int]): tokens of each player
+      card_up (int): card on offer (0 once the game is over)
+      pot (int): tokens on card_up
+      turn (int): position of the player to move
+      remaining (int): number of cards left in the deck
+      unseen (int): bitmask of the cards neither held nor face up (the
+              deck and the discards)
+      deck (List[int]): cards left in the deck, drawn from the end, or None
+              if unknown
+
+    Methods:
+      from_table()
+      copy()
+      unseen_cards()
+      determinize()
+      take()
+      pass_card()
+      scores()
+    """
+
+    __slots__ = ('hands', 'tokens', 'card_up', 'pot', 'turn', 'remaining', \
+                 'unseen', 'deck')
+
+    def __init__(self, hands, tokens, card_up, pot, turn, remaining, unseen, \
+                 deck=None):
+        self.hands = hands
+        self.tokens = tokens
+        self.card_up = card_up
+        self.pot = pot
+        self.turn = turn
+        self.remaining = remaining
+        self.unseen = unseen
+        self.deck = deck
+
+    @classmethod
+    def from_table(cls, table):
+        """The state of a Table, as seen by the player to move."""
+        hands = [player.hand for player in table.players]
+        seen = 1 << table.card_up
+        for hand in hands:
+            seen |= hand
+        all_cards = ((1 << (table.deck.max_card + 1)) - 1) \
+                    ^ ((1 << table.deck.min_card) - 1)
+        return cls(hands, [player.tokens for player in table.players], \
+                   table.card_up, table.pot, table.whose_turn, \
+                   len(table.deck), all_cards & ~seen)
+
+    def copy(self):
+        return GameState(self.hands[:], self.tokens[:], self.card_up, \
+                         self.pot, self.turn, self.remaining, self.unseen, \
+                         None if self.deck is None else self.deck[:])
+
+    def unseen_cards(self):
+        """List of the unseen cards, in increasing order."""
+        unseen = []
+        rest = self.unseen
+        while rest:
+            low = rest & -rest
+            unseen.append(low.bit_length() - 1)
+            rest ^= low
+        return unseen
+
+    def determinize(self, rng, unseen=None):
+        """
+        Return a copy with the hidden cards dealt: remaining of the unseen
+        cards, chosen and ordered at random, make up the deck.
+
+        Args:
+          rng (random.Random)
+          unseen (List[int]): unseen_cards(), if already known
+        """
+        if unseen is None:
+            unseen = self.unseen_cards()
+        state = self.copy()
+        state.deck = rng.sample(unseen, self.remaining)
+        return state
+
+    def take(self):
+        """The player to move takes card_up and the pot."""
+        self.hands[self.turn] |= 1 << self.card_up
+        self.tokens[self.turn] += self.pot
+        self.pot = 0
+        if self.remaining:
+            self.remaining -= 1
+            self.card_up = self.deck.pop()
+            self.unseen &= ~(1 << self.card_up)
+        else:
+            self.card_up = 0
+
+    def pass_card(self):
+        """The player to move plays a token and passes."""
+        self.tokens[self.turn] -= 1
+        self.pot += 1
+        self.turn = (self.turn + 1) % len(self.hands)
+
+    def scores(self):
+        """Scores as Player.get_score() computes them."""
+        scores = []
+        for hand, tokens in zip(self.hands, self.tokens):
+            heads = hand & ~(hand << 1)
+            tot = 0
+            if heads:
+                while heads:
+                    low = heads & -heads
+                    tot += low.bit_length() - 1
+                    heads ^= low
+                tot -= tokens
+            scores.append(tot)
+        return scores
+
+
+def rewards(scores):
+    """Share of the win of each player (ties split the win)."""
+    best = min(scores)
+    winners = scores.count(best)
+    return [1.0 / winners if score == best else 0.0 for score in scores]
+
+
+def rollout(state, thresholds):
+    """
+    Play a determinized state out to the end, in place, with a fixed
+    threshold policy: a player takes the card once its value to the player
+    (the change in their score, less the pot) is at most their threshold,
+    or when out of tokens.
+
+    Under that policy the pot grows by one at every pass, so the player who
+    ends up taking each card, and how many times everybody passed on it,
+    follow directly from the thresholds: a card costs O(players), however
+    long it goes around the table.
+
+    Returns:
+      List[int]: final scores
+    """
+    hands = state.hands
+    tokens = state.tokens
+    deck = state.deck
+    P = len(hands)
+    card = state.card_up
+    pot = state.pot
+    turn = state.turn
+    seats = range(P)
+    while card:
+        # The earliest decision (counting from turn) at which anyone takes.
+        # Nobody after a player who takes at once can come before them.
+        first = 1 << 30
+        i = turn
+        for d in seats:
+            hand = hands[i] >> (card - 1)
+            if hand & 4:
+                value = -(card + 1) if hand & 1 else -1
+            else:
+                value = 0 if hand & 1 else card
+            # Passes before this player's pot reaches the threshold.
+            passes = value - thresholds[i] - pot - d
+            if passes <= 0:
+                if d < first:
+                    first = d
+                    taker = i
+                break
+            passes = (passes + P - 1) // P
+            if passes > tokens[i]:
+                passes = tokens[i]
+            at = d + passes * P
+            if at < first:
+                first = at
+                taker = i
+            i += 1
+            if i == P:
+                i = 0
+        i = turn
+        for d in seats:
+            if d >= first:
+                break
+            tokens[i] -= (first - d + P - 1) // P
+            i += 1
+            if i == P:
+                i = 0
+        hands[taker] |= 1 << card
+        tokens[taker] += pot + first
+        pot = 0
+        turn = taker
+        card = deck.pop() if deck else 0
+    state.card_up = 0
+    state.pot = 0
+    state.turn = turn
+    state.remaining = 0
+    return state.scores()
+
+
+class Node(object):
+    """Information-set tree node, reached by one action.
+
+    A node reached by PASS is where the next player decides. After TAKE
+    the next card is turned up, so a TAKE node only branches on that card
+    (keyed by its value, 0 if the game ended), into decision nodes.
+
+    Attributes:
+      children (dict): child Node by action (TAKE, PASS), or by card under
+              a TAKE node
+      visits (int): times the action leading here was chosen
+      reward (float): total reward of the player who chose it
+      avail (int): times that action was available (IS-MCTS selection)
+    """
+
+    __slots__ = ('children', 'visits', 'reward', 'avail')
+
+    def __init__(self):
+        self.children = {}
+        self.visits = 0
+        self.reward = 0.0
+        self.avail = 0
+
+
+def search(state, rollouts=None, time_budget=None, seed=None, \
+           exploration=0.7, rollout_thresholds=(0, 12)):
+    """
+    Single-observer information-set MCTS from a GameState.
+
+    Each iteration deals the hidden cards at random (determinization),
+    descends the tree with UCB1 over the actions compatible with that deal,
+    adds a node, plays the rest of the game with rollout() and credits each
+    action with the share of the win of the player who chose it.
+
+    Args:
+      state (GameState): position to search, as seen by the player to move
+      rollouts (int): number of iterations
+      time_budget (float): seconds to search (if rollouts is not given)
+      seed: seed for the search's random.Random
+      exploration (float): UCB1 exploration constant
+      rollout_thresholds (tuple): range of the thresholds of the rollout
+              policy, drawn per player for every rollout
+
+    Returns:
+      dict: (visits, total reward) of 'take' and 'pass' at the root
+    """
+    rng = random.Random(seed)
+    randint = rng.randint
+    low, high = rollout_thresholds
+    P = len(state.hands)
+    root = Node()
+    unseen = state.unseen_cards()
+    if rollouts is None and time_budget is None:
+        rollouts = 1000
+    deadline = None if time_budget is None \
+               else time.perf_counter() + time_budget
+    done = 0
+    while True:
+        if rollouts is not None and done >= rollouts:
+            break
+        # Checking the clock costs more than an iteration; do it every 64.
+        if deadline is not None and done % 64 == 0 and done \
+           and time.perf_counter() > deadline:
+            break
+        done += 1
+        current = state.determinize(rng, unseen)
+        node = root
+        path = []
+        expanded = False
+        while current.card_up and not expanded:
+            mover = current.turn
+            actions = (TAKE, PASS) if current.tokens[mover] else (TAKE,)
+            best = None
+            for action in actions:
+                child = node.children.get(action)
+                if child is None:
+                    child = node.children[action] = Node()
+                child.avail += 1
+                if expanded:
+                    continue
+                if child.visits == 0:
+                    # Expand the first untried action.
+                    best = child
+                    best_action = action
+                    expanded = True
+                    continue
+                value = child.reward / child.visits + exploration \
+                        * math.sqrt(math.log(child.avail) / child.visits)
+                if best is None or value > best_value:
+                    best = child
+                    best_action = action
+                    best_value = value
+            path.append((best, mover))
+            if best_action == PASS:
+                current.pass_card()
+                node = best
+            else:
+                current.take()
+                node = best.children.get(current.card_up)
+                if node is None:
+                    node = best.children[current.card_up] = Node()
+        if current.card_up:
+            scores = rollout(current, [randint(low, high) for i in range(P)])
+        else:
+            scores = current.scores()
+        reward = rewards(scores)
+        for child, mover in path:
+            child.visits += 1
+            child.reward += reward[mover]
+    stats = {'take': (0, 0.0), 'pass': (0, 0.0)}
+    for action, child in root.children.items():
+        stats['pass' if action == PASS else 'take'] = \
+            (child.visits, child.reward)
+    return stats
+
+
+def search_task(task):
+    """search() with its arguments packed in a tuple, for a process pool."""
+    return search(*task)
+
+
+class MCTSStrategy(Strategy):
+    """Decides every move with an IS-MCTS search (see search()).
+
+    The search runs for a fixed number of rollouts or a time budget per
+    move. With several workers, each worker process searches independently
+    from its own seed and the root statistics are summed (root
+    parallelization).
+
+    Methods:
+      decide()
+      close()
+    """
+
+    def __init__(self, rollouts=None, time_budget=None, workers=1, \
+                 exploration=0.7, rollout_thresholds=(0, 12), rng=None):
+        """
+        Args:
+          rollouts (int): rollouts per move (default 1000, unless
+                  time_budget is given)
+          time_budget (float): seconds of search per move
+          workers (int): processes to search with (None: one per CPU)
+          exploration, rollout_thresholds: as for search()
+          rng (random.Random): source of search seeds (default: the
+                  table's)
+        """
+        self.rollouts = rollouts
+        self.time_budget = time_budget
+        self.workers = workers or os.cpu_count() or 1
+        self.exploration = exploration
+        self.rollout_thresholds = rollout_thresholds
+        self.rng = rng
+        self.pool = None
+
+    def decide(self, table, player):
+        rng = table.rng if self.rng is None else self.rng
+        state = GameState.from_table(table)
+        tasks = [(state, self.rollouts, self.time_budget, \
+                  rng.getrandbits(64), self.exploration, \
+                  self.rollout_thresholds) for i in range(self.workers)]
+        if self.workers == 1:
+            results = [search_task(tasks[0])]
+        else:
+            if self.pool is None:
+                self.pool = Pool(self.workers)
+            results = self.pool.map(search_task, tasks)
+        take = sum(result['take'][0] for result in results)
+        pass_ = sum(result['pass'][0] for result in results)
+        return take >= pass_
+
+    def close(self):
+        """Shut down the worker pool, if any."""
+        if self.pool is not None:
+            self.pool.close()
+            self.pool.join()
+            self.pool = None
+
+
+class MCTSPlayer(Player):
+    """A Player whose every decision comes from an MCTSStrategy.
+
+    Methods:
+      close()
+    """
+
+    def __init__(self, pos, rollouts=None, time_budget=None, workers=1, \
+                 exploration=0.7, rollout_thresholds=(0, 12), rng=None, \
+                 *args, **kwargs):
+        """
+        Args:
+          pos (int): Position in play order (starting from 0)
+          rollouts, time_budget, workers, exploration, rollout_thresholds,
+          rng: as for MCTSStrategy
+          args, kwargs: thresholds, as for Player (not used in decisions)
+        """
+        Player.__init__(self, pos, *args, **kwargs)
+        self.strategy = MCTSStrategy(rollouts, time_budget, workers, \
+                                     exploration, rollout_thresholds, rng)
+
+    def close(self):
+        """Shut down the search's worker pool, if any."""
+        self.strategy.close()
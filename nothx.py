@@ -1,12 +1,439 @@
 #!/usr/bin/python3
+import os
 import sys
+import time
+import json
+import argparse
 from table import Table
+from player import Player
 
-def main():
-    mytable = Table(num_ai_players=3, verbose=2)
+
+def play(args):
+    mytable = Table(num_ai_players=args.players, verbose=args.verbose)
     mytable.play()
     mytable.score()
 
 
+def tournament(args):
+    from tournament import iter_tournament, summarize
+    start = time.perf_counter()
+    games = iter_tournament(args.games, args.players, args.seed, args.workers)
+    summary = summarize(record(games, args))
+    elapsed = time.perf_counter() - start
+    print('{0:3}  {1:>6}  {2:>6}  {3:>6}  {4:>6}'\
+          .format('Pos', 'Games', 'Wins', 'Ties', 'Score'))
+    for pos, games, wins, ties, score in summary:
+        print('{0:3d}  {1:6d}  {2:6d}  {3:6d}  {4:6.2f}'\
+              .format(pos, games, wins, ties, score))
+    print("{0} games in {1:.2f} s ({2:.0f} games/sec)"\
+          .format(args.games, elapsed, args.games / elapsed))
+
+
+def stats(args):
+    from tournament import iter_stats
+    start = time.perf_counter()
+    for current in iter_stats(args.games, args.players, args.seed, \
+                              args.workers):
+        if args.live:
+            print_stats(current)
+    if not args.live:
+        print_stats(current)
+    elapsed = time.perf_counter() - start
+    print("{0} games in {1:.2f} s ({2:.0f} games/sec)"\
+          .format(current.games, elapsed, current.games / elapsed))
+
+
+def tablebase(args):
+    from tablebase import build
+    start = time.perf_counter()
+    num = build(args.output, args.games, args.players, args.remaining, \
+                args.token_cap, args.seed)
+    elapsed = time.perf_counter() - start
+    print("{0} positions from {1} games in {2:.2f} s, written to {3}"\
+          .format(num, args.games, elapsed, args.output))
+
+
+def optimize(args):
+    from optimize import optimize
+    start = time.perf_counter()
+    results, total = optimize(args.players, args.population, \
+                              args.generations, args.elite, args.batch, \
+                              args.max_games, seed=args.seed, \
+                              workers=args.workers)
+    elapsed = time.perf_counter() - start
+    print('{0:>20}  {1:>9}  {2:>6}  {3:>6}  {4:>6}'\
+          .format('Thresholds', 'Win share', '+/-', 'Score', 'Games'))
+    for candidate, mean, half, score, games in results:
+        print('{0:>20}  {1:9.3f}  {2:6.3f}  {3:6.2f}  {4:6d}'\
+              .format(' '.join(str(x) for x in candidate), mean, half, \
+                      score, games))
+    print("{0} games in {1:.2f} s".format(total, elapsed))
+
+
+def compare(args):
+    from paired import compare
+    start = time.perf_counter()
+    result = compare(args.first, args.second, args.deals, args.players, \
+                     args.seed, args.antithetic, args.workers)
+    elapsed = time.perf_counter() - start
+    print('{0:>9}  {1:>9}  {2:>9}  {3:>9}  {4:>9}  {5:>9}'\
+          .format('', 'First', 'Second', 'Diff', '+/-', 'Var. cut'))
+    for what in ('reward', 'score'):
+        diff = getattr(result, what + '_diff')
+        print('{0:>9}  {1:9.3f}  {2:9.3f}  {3:9.3f}  {4:9.3f}  {5:9.1f}'\
+              .format('win share' if what == 'reward' else what, \
+                      getattr(result, what)[0].mean, \
+                      getattr(result, what)[1].mean, diff.mean, \
+                      2 * diff.sem, result.variance_reduction(what)))
+    print("{0} deals, {1} games in {2:.2f} s"\
+          .format(args.deals, result.games, elapsed))
+
+
+def league(args):
+    import random
+    from league import League
+    from optimize import random_candidate
+    rng = random.Random("{}:entries".format(args.seed))
+    entries = []
+    for i in range(args.entries):
+        candidate = random_candidate(rng)
+        entries.append((','.join(str(x) for x in candidate), candidate))
+    start = time.perf_counter()
+    myleague = League(entries, args.players, args.seed, args.workers, \
+                      args.checkpoint).run(args.games, args.batch)
+    elapsed = time.perf_counter() - start
+    print('{0:>14}  {1:>7}  {2:>7}  {3:>6}  {4:>7}  {5:>6}'\
+          .format('Thresholds', 'Rating', 'Mu', 'Sigma', 'Elo', 'Games'))
+    for name, rating, mu, sigma, elo, games in myleague.leaderboard():
+        print('{0:>14}  {1:7.2f}  {2:7.2f}  {3:6.2f}  {4:7.1f}  {5:6d}'\
+              .format(name, rating, mu, sigma, elo, games))
+    print("{0} games in {1:.2f} s ({2} in total)"\
+          .format(args.games, elapsed, myleague.games))
+
+
+def features(args):
+    from features import write_features
+    start = time.perf_counter()
+    rows = write_features(args.output, args.games, args.players, args.seed, \
+                          args.workers)
+    elapsed = time.perf_counter() - start
+    print("{0} rows from {1} games in {2:.2f} s, written to {3}"\
+          .format(rows, args.games, elapsed, args.output))
+
+
+def train(args):
+    from features import train, FEATURES
+    start = time.perf_counter()
+    score_model, win_model, metrics = train(args.input, args.epochs, \
+                                            args.holdout)
+    elapsed = time.perf_counter() - start
+    print('{0:>18}  {1:>10}  {2:>10}'.format('', 'Score', 'Win (std.)'))
+    for name, score, win in zip(('intercept',) + FEATURES, \
+                                score_model.coef, win_model.coef):
+        print('{0:>18}  {1:10.4f}  {2:10.4f}'.format(name, score, win))
+    if metrics:
+        print("held out: {0} rows, score RMSE {1:.2f}, R^2 {2:.3f}, "
+              "win log loss {3:.4f}, accuracy {4:.3f}"\
+              .format(metrics['rows'], metrics['score_rmse'], \
+                      metrics['score_r2'], metrics['win_log_loss'], \
+                      metrics['win_accuracy']))
+    print("trained on {0} rows in {1:.2f} s"\
+          .format(score_model.n, elapsed))
+
+
+def serve(args):
+    import asyncio
+    from server import serve
+    print("Serving on {}".format(args.address))
+    try:
+        asyncio.run(serve(args.address, args.timeout, args.max_players))
+    except KeyboardInterrupt:
+        pass
+
+
+def loadtest(args):
+    import asyncio
+    from server import load_test, local_load_test, print_report
+    if args.address:
+        report = asyncio.run(load_test(args.address, args.clients, \
+                                       args.games, args.players, \
+                                       args.remote, args.stall, args.seed))
+    else:
+        report = local_load_test(args.clients, args.games, args.players, \
+                                 args.remote, args.stall, args.timeout, \
+                                 args.seed, args.max_players)
+    print_report(report)
+
+
+def trace(args):
+    from traces import record_games
+    start = time.perf_counter()
+    record_games(args.output, args.games, args.players, args.seed)
+    elapsed = time.perf_counter() - start
+    print("{0} games in {1:.2f} s, appended to {2}"\
+          .format(args.games, elapsed, args.output))
+
+
+def replay(args):
+    from traces import TraceReader
+    mytable = TraceReader(args.file).replay(args.game, args.moves, \
+                                            verbose=args.verbose)
+    if mytable.game_over:
+        mytable.score()
+
+
+def print_stats(stats):
+    print("\nGames: {}".format(stats.games))
+    for outcome in ('win', 'lose'):
+        lengths = stats.hand_length[outcome]
+        score = stats.score[outcome]
+        print("{0:4} hands: {1:7d}  mean cards {2:5.2f}  "
+              "mean score {3:6.2f} +/- {4:.2f}"\
+              .format(outcome, stats.hands[outcome], lengths.mean(), \
+                      score.mean, score.sem))
+    print('{0:>17}  {1:>5}  {2:>7}  {3:>8}'\
+          .format('', 'Value', 'Games', 'Win rate'))
+    for pos, games, rate in stats.position.table():
+        print('{0:>17}  {1:5d}  {2:7d}  {3:8.3f}'\
+              .format('pos', pos, games, rate))
+    for name, threshold in stats.thresholds.items():
+        for value, games, rate in threshold['rate'].table():
+            print('{0:>17}  {1:5d}  {2:7d}  {3:8.3f}'\
+                  .format(name, value, games, rate))
+
+
+def record(games, args):
+    """Pass games through, writing them to the requested outputs."""
+    f = open(args.output, 'w') if args.output else None
+    writer = None
+    if args.columns:
+        from results import ResultsWriter
+        writer = ResultsWriter(args.columns)
+    for game in games:
+        if f:
+            f.write(json.dumps(game) + '\n')
+        if writer:
+            writer.add(game)
+        yield game
+    if f:
+        f.close()
+    if writer:
+        writer.close()
+
+
+def positive(text):
+    """argparse type for counts of at least 1."""
+    value = int(text)
+    if value < 1:
+        raise argparse.ArgumentTypeError("must be at least 1")
+    return value
+
+
+def nonnegative(text):
+    """argparse type for counts of at least 0."""
+    value = int(text)
+    if value < 0:
+        raise argparse.ArgumentTypeError("must be at least 0")
+    return value
+
+
+def thresholds(text):
+    """argparse type for init,eff_val,token,pot thresholds."""
+    try:
+        values = tuple(int(x) for x in text.split(','))
+    except ValueError:
+        raise argparse.ArgumentTypeError("expected integers")
+    if len(values) != 4:
+        raise argparse.ArgumentTypeError("expected init,eff_val,token,pot")
+    try:
+        Player(0, *values)
+    except ValueError as error:
+        raise argparse.ArgumentTypeError(str(error))
+    return values
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Simulate No Thanks games")
+    commands = parser.add_subparsers(dest='command')
+
+    cmd = commands.add_parser('play', help="play a single game (default)")
+    cmd.add_argument('-p', '--players', type=positive, default=3)
+    cmd.add_argument('-v', '--verbose', type=int, default=2)
+    cmd.set_defaults(func=play)
+
+    cmd = commands.add_parser('tournament', \
+                              help="play many games on a process pool")
+    cmd.add_argument('-n', '--games', type=positive, default=10000)
+    cmd.add_argument('-p', '--players', type=positive, default=3)
+    cmd.add_argument('-s', '--seed', default='0')
+    cmd.add_argument('-w', '--workers', type=positive, default=None, \
+                     help="worker processes (default: one per CPU)")
+    cmd.add_argument('-o', '--output', \
+                     help="write each game's Table.score() as a JSON line")
+    cmd.add_argument('-c', '--columns', metavar='DIR', \
+                     help="write results as columnar .npy chunks (see "
+                          "results.py)")
+    cmd.set_defaults(func=tournament)
+
+    cmd = commands.add_parser('stats', help="play many games and report "
+                              "strategy statistics without storing them")
+    cmd.add_argument('-n', '--games', type=positive, default=10000)
+    cmd.add_argument('-p', '--players', type=positive, default=3)
+    cmd.add_argument('-s', '--seed', default='0')
+    cmd.add_argument('-w', '--workers', type=positive, default=None, \
+                     help="worker processes (default: one per CPU)")
+    cmd.add_argument('-l', '--live', action='store_true', \
+                     help="print the statistics after every block of games")
+    cmd.set_defaults(func=stats)
+
+    cmd = commands.add_parser('tablebase', help="solve endgame positions and "
+                              "write them to a tablebase file")
+    cmd.add_argument('-n', '--games', type=positive, default=1000)
+    cmd.add_argument('-p', '--players', type=positive, default=3)
+    cmd.add_argument('-r', '--remaining', type=nonnegative, default=1, \
+                     help="solve positions with at most this many cards "
+                          "left in the deck")
+    cmd.add_argument('-t', '--token-cap', type=nonnegative, default=8)
+    cmd.add_argument('-s', '--seed', default='0')
+    cmd.add_argument('-o', '--output', default='endgame.tb')
+    cmd.set_defaults(func=tablebase)
+
+    cmd = commands.add_parser('optimize', help="search for the best "
+                              "thresholds (init, eff_val, token, pot)")
+    cmd.add_argument('-p', '--players', type=positive, default=3)
+    cmd.add_argument('-P', '--population', type=positive, default=16)
+    cmd.add_argument('-g', '--generations', type=positive, default=6)
+    cmd.add_argument('-e', '--elite', type=positive, default=4)
+    cmd.add_argument('-b', '--batch', type=positive, default=200, \
+                     help="games per candidate per racing round")
+    cmd.add_argument('-m', '--max-games', type=positive, default=2000, \
+                     help="games per candidate per generation, at most")
+    cmd.add_argument('-s', '--seed', default='0')
+    cmd.add_argument('-w', '--workers', type=positive, default=None, \
+                     help="worker processes (default: one per CPU)")
+    cmd.set_defaults(func=optimize)
+
+    cmd = commands.add_parser('compare', help="compare two sets of "
+                              "thresholds on the same deals and seats")
+    cmd.add_argument('first', type=thresholds, \
+                     help="thresholds init,eff_val,token,pot")
+    cmd.add_argument('second', type=thresholds, \
+                     help="thresholds init,eff_val,token,pot")
+    cmd.add_argument('-n', '--deals', type=positive, default=1000)
+    cmd.add_argument('-p', '--players', type=positive, default=3)
+    cmd.add_argument('-s', '--seed', default='0')
+    cmd.add_argument('-a', '--antithetic', action='store_true', \
+                     help="also play the antithetic twin of every deck")
+    cmd.add_argument('-w', '--workers', type=positive, default=None, \
+                     help="worker processes (default: one per CPU)")
+    cmd.set_defaults(func=compare)
+
+    cmd = commands.add_parser('league', help="rate a population of random "
+                              "threshold players against each other")
+    cmd.add_argument('-e', '--entries', type=positive, default=16)
+    cmd.add_argument('-n', '--games', type=positive, default=3000)
+    cmd.add_argument('-p', '--players', type=positive, default=3)
+    cmd.add_argument('-s', '--seed', default='0')
+    cmd.add_argument('-w', '--workers', type=positive, default=None, \
+                     help="worker processes (default: one per CPU)")
+    cmd.add_argument('-b', '--batch', type=positive, default=32, \
+                     help="matches scheduled and rated per batch "
+                          "(default 32)")
+    cmd.add_argument('-c', '--checkpoint', \
+                     help="JSON file to save the league to, and resume from")
+    cmd.set_defaults(func=league)
+
+    cmd = commands.add_parser('features', help="play games and write "
+                              "per-player feature rows as float32 blocks")
+    cmd.add_argument('-n', '--games', type=positive, default=100000)
+    cmd.add_argument('-p', '--players', type=positive, default=3)
+    cmd.add_argument('-s', '--seed', default='0')
+    cmd.add_argument('-w', '--workers', type=positive, default=None, \
+                     help="worker processes (default: one per CPU)")
+    cmd.add_argument('-o', '--output', default='features')
+    cmd.set_defaults(func=features)
+
+    cmd = commands.add_parser('train', help="fit score and win models on "
+                              "feature blocks, out of core")
+    cmd.add_argument('input', help="directory written by features")
+    cmd.add_argument('-e', '--epochs', type=positive, default=1)
+    cmd.add_argument('-H', '--holdout', type=nonnegative, default=1, \
+                     help="last blocks kept out of training for evaluation")
+    cmd.set_defaults(func=train)
+
+    cmd = commands.add_parser('serve', help="host games for remote clients "
+                              "(see server.py for the protocol)")
+    cmd.add_argument('-a', '--address', default='127.0.0.1:7433', \
+                     help="host:port, or a Unix socket path")
+    cmd.add_argument('-t', '--timeout', type=float, default=10.0, \
+                     help="seconds a client has for each move")
+    cmd.add_argument('-m', '--max-players', type=positive, default=12, \
+                     help="most players per table (default 12)")
+    cmd.set_defaults(func=serve)
+
+    cmd = commands.add_parser('loadtest', help="drive a server with "
+                              "synthetic clients and report move latency")
+    cmd.add_argument('-a', '--address', default=None, \
+                     help="server to test (default: start one locally)")
+    cmd.add_argument('-c', '--clients', type=positive, default=200)
+    cmd.add_argument('-n', '--games', type=positive, default=5, \
+                     help="games per client")
+    cmd.add_argument('-p', '--players', type=positive, default=3)
+    cmd.add_argument('-r', '--remote', type=positive, default=1, \
+                     help="client seats per table")
+    cmd.add_argument('--stall', type=float, default=0.0, \
+                     help="chance that a client ignores its turn")
+    cmd.add_argument('-t', '--timeout', type=float, default=1.0, \
+                     help="move timeout of the local server")
+    cmd.add_argument('-m', '--max-players', type=positive, default=12, \
+                     help="most players per table of the local server "
+                          "(default 12)")
+    cmd.add_argument('-s', '--seed', default='0')
+    cmd.set_defaults(func=loadtest)
+
+    cmd = commands.add_parser('trace', help="play games and append their "
+                              "traces to a trace file")
+    cmd.add_argument('-n', '--games', type=positive, default=10000)
+    cmd.add_argument('-p', '--players', type=positive, default=3)
+    cmd.add_argument('-s', '--seed', default='0')
+    cmd.add_argument('-o', '--output', default='games.trace')
+    cmd.set_defaults(func=trace)
+
+    cmd = commands.add_parser('replay', help="replay a game from a trace "
+                              "file")
+    cmd.add_argument('file')
+    cmd.add_argument('game', type=nonnegative)
+    cmd.add_argument('-m', '--moves', type=nonnegative, default=None, \
+                     help="stop after this many actions")
+    cmd.add_argument('-v', '--verbose', type=int, default=1)
+    cmd.set_defaults(func=replay)
+
+    # Arguments without a subcommand are play's, e.g. "nothx.py -p 4".
+    argv = sys.argv[1:] if argv is None else list(argv)
+    if not argv or argv[0] not in commands.choices \
+       and argv[0] not in ('-h', '--help'):
+        argv = ['play'] + argv
+    args = parser.parse_args(argv)
+    if args.command == 'tournament' and args.columns \
+       and os.path.isdir(args.columns) and os.listdir(args.columns):
+        parser.error("{} is not empty".format(args.columns))
+    if args.command == 'train':
+        from features import iter_blocks
+        if not os.path.isdir(args.input) \
+           or next(iter_blocks(args.input), None) is None:
+            parser.error("no feature blocks in {}".format(args.input))
+    if args.command == 'league' and args.entries < args.players:
+        parser.error("a league needs at least as many entries as players")
+    if args.command == 'loadtest' and args.remote > args.players:
+        parser.error("cannot seat more clients than players at a table")
+    if args.command == 'loadtest' and not args.address \
+       and args.players > args.max_players:
+        parser.error("the local server seats up to {} players per table"\
+                     .format(args.max_players))
+    if args.command == 'trace' and args.players > 255:
+        parser.error("traces store up to 255 players")
+    args.func(args)
+
+
 if __name__ == "__main__":
     main()
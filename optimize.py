@@ -0,0 +1,201 @@
+import os
+import random
+from multiprocessing import Pool
+from player import Player
+from table import Table
+from stats import Moments
+from tournament import game_rng
+
+# Search range of each threshold (inclusive), in Player argument order.
+BOUNDS = (
+    ('init_threshold', 3, 34),
+    ('eff_val_threshold', -5, 20),
+    ('token_threshold', 0, 10),
+    ('pot_threshold', 0, 25),
+)
+
+
+def play_candidate(task):
+    """
+    Play a block of games with one candidate against randomized opponents.
+
+    The candidate's seat rotates with the game index, and game g is dealt
+    from game_rng(seed, g), so every candidate of a race meets the same
+    opponents and decks (common random numbers).
+
+    Args:
+      task (tuple): (seed, first game, last game + 1, candidate thresholds,
+              number of players, Table keyword args)
+
+    Returns:
+      tuple: Moments of the candidate's reward (1 won, 0.5 tied, 0 lost)
+             and of its score
+    """
+    seed, start, stop, candidate, num_players, table_args = task
+    reward = Moments()
+    score = Moments()
+    player = Player(0, *candidate)
+    mytable = None
+    for game in range(start, stop):
+        player.pos = game % num_players
+        if mytable is None:
+            mytable = Table(players=[player], \
+                            num_ai_players=num_players - 1, verbose=0, \
+                            rng=game_rng(seed, game), **table_args)
+        else:
+            mytable.reset(players=[player], rng=game_rng(seed, game))
+        mytable.play()
+        features = mytable.score()[player.pos]
+        reward.add((0.0, 1.0, 0.5)[features[0]])
+        score.add(features[1])
+    return reward, score
+
+
+class Entry(object):
+    """A candidate and the statistics of its games so far.
+
+    Attributes:
+      candidate (tuple): (init, eff_val, token, pot) thresholds
+      reward (Moments): win share per game
+      score (Moments): final score per game
+    """
+
+    def __init__(self, candidate):
+        self.candidate = candidate
+        self.reward = Moments()
+        self.score = Moments()
+
+    def bounds(self, z):
+        """Confidence interval on the mean reward, mean +/- z * sem."""
+        half = z * self.reward.sem
+        return self.reward.mean - half, self.reward.mean + half
+
+
+def race(candidates, seed, num_players=3, batch=200, max_games=2000, \
+         min_games=400, z=2.0, mapper=map, **table_args):
+    """
+    Evaluate candidates in rounds of batch games each, dropping every
+    candidate whose upper confidence bound on win share falls below the
+    best lower bound, until one is left or each has played max_games.
+    Every candidate plays at least min_games (at most max_games), even a
+    lone one, so that each is evaluated.
+
+    Args:
+      candidates: threshold tuples
+      seed: seed of the games (see play_candidate())
+      min_games (int): games each candidate plays before any is dropped
+      z (float): width of the confidence intervals, in standard errors
+      mapper: map-like callable to run play_candidate() tasks with, e.g.
+              Pool.map
+
+    Returns:
+      tuple: (surviving Entries, best first; all Entries; games played)
+    """
+    entries = [Entry(tuple(candidate)) for candidate in candidates]
+    alive = list(entries)
+    played = 0
+    start = 0
+    while start < max_games and (len(alive) > 1 or start < min_games):
+        stop = min(start + batch, max_games)
+        tasks = [(seed, start, stop, entry.candidate, num_players, \
+                  table_args) for entry in alive]
+        for entry, (reward, score) in zip(alive, mapper(play_candidate, \
+                                                        tasks)):
+            entry.reward.merge(reward)
+            entry.score.merge(score)
+        played += (stop - start) * len(alive)
+        start = stop
+        if start >= min_games:
+            best_lower = max(entry.bounds(z)[0] for entry in alive)
+            alive = [entry for entry in alive \
+                     if entry.bounds(z)[1] >= best_lower]
+    alive.sort(key=lambda entry: entry.reward.mean, reverse=True)
+    return alive, entries, played
+
+
+def random_candidate(rng):
+    return tuple(rng.randint(low, high) for name, low, high in BOUNDS)
+
+
+def mutate(candidate, rng, scale=0.15):
+    """
+    Gaussian step on every threshold, scale times its range, rounded and
+    clipped to BOUNDS.
+    """
+    child = []
+    for value, (name, low, high) in zip(candidate, BOUNDS):
+        value = int(round(value + rng.gauss(0, scale * (high - low))))
+        child.append(min(high, max(low, value)))
+    return tuple(child)
+
+
+def optimize(num_players=3, population=16, generations=6, elite=4, \
+             batch=200, max_games=2000, min_games=400, z=2.0, seed=0, \
+             workers=None, verbose=True, **table_args):
+    """
+    Evolutionary search for the best thresholds, with racing.
+
+    Every generation races its population (see race()); the best elite
+    survivors are kept and the rest of the next generation are mutations
+    of them. Each generation plays fresh games, so the elites' estimates
+    are not biased by the games that selected them.
+
+    Args:
+      num_players (int): players per table, the candidate included
+      population (int): candidates per generation
+      generations (int): number of generations
+      elite (int): candidates carried over to the next generation
+      batch, max_games, min_games, z: as for race()
+      seed: seed of the search and of the games
+      workers (int): worker processes (default: one per CPU)
+      table_args: further keyword arguments for Table
+
+    Returns:
+      tuple: (list of (candidate, mean win share, CI half-width, mean
+             score, games) for the last generation, survivors first, best
+             first; total games played)
+
+    Raises:
+      ValueError: if there is not at least one generation and one
+              candidate
+    """
+    if generations < 1:
+        raise ValueError("optimize needs at least 1 generation")
+    if population < 1:
+        raise ValueError("optimize needs at least 1 candidate")
+    if workers is None:
+        workers = os.cpu_count() or 1
+    rng = random.Random("{}:search".format(seed))
+    pool = Pool(workers) if workers > 1 else None
+    mapper = pool.map if pool else map
+    candidates = [random_candidate(rng) for i in range(population)]
+    total = 0
+    try:
+        for generation in range(generations):
+            alive, entries, played = race(
+                candidates, "{}:{}".format(seed, generation), num_players, \
+                batch, max_games, min_games, z, mapper, **table_args)
+            total += played
+            if verbose:
+                best = alive[0]
+                print("Generation {0}: {1} survivors of {2}, {3} games; "
+                      "best {4} win share {5:.3f} +/- {6:.3f}"\
+                      .format(generation, len(alive), len(entries), played, \
+                              best.candidate, best.reward.mean, \
+                              z * best.reward.sem))
+            ranked = alive + sorted(
+                [entry for entry in entries if entry not in alive], \
+                key=lambda entry: entry.reward.mean, reverse=True)
+            parents = [entry.candidate for entry in ranked[:elite]]
+            candidates = list(parents)
+            while len(candidates) < population:
+                child = mutate(rng.choice(parents), rng)
+                if child not in candidates:
+                    candidates.append(child)
+    finally:
+        if pool:
+            pool.close()
+            pool.join()
+    results = [(entry.candidate, entry.reward.mean, z * entry.reward.sem, \
+                entry.score.mean, entry.reward.n) for entry in ranked]
+    return results, total
@@ -0,0 +1,201 @@
+import os
+import random
+from multiprocessing import Pool
+from deck import Deck
+from player import Player
+from table import Table
+from stats import Moments
+from tournament import game_rng
+
+
+def deal_orders(rng, num_cards=33, offset=3, antithetic=False):
+    """
+    Shuffled setup decks (see Deck's order argument) from one stream of
+    uniforms.
+
+    Fisher-Yates picks card j of the first i + 1 at step i; the antithetic
+    deck picks card i - j from the same uniform instead (u -> 1 - u), so
+    the two decks are negatively correlated draw by draw.
+
+    Returns:
+      list: one order, or two with antithetic
+    """
+    order = list(range(offset, offset + num_cards))
+    mirror = list(order) if antithetic else None
+    for i in range(num_cards - 1, 0, -1):
+        j = int(rng.random() * (i + 1))
+        order[i], order[j] = order[j], order[i]
+        if antithetic:
+            mirror[i], mirror[i - j] = mirror[i - j], mirror[i]
+    return [order, mirror] if antithetic else [order]
+
+
+def make_player(candidate, pos):
+    """A Player from a candidate: thresholds, or a callable taking pos."""
+    if callable(candidate):
+        return candidate(pos)
+    return Player(pos, *candidate)
+
+
+def play_deals(task):
+    """
+    Play a block of deals under every candidate.
+
+    Deal d is played from every seat, and with antithetic also from its
+    antithetic twin, by each candidate in turn. Each time the table's
+    random stream (opponents' thresholds, their random choices) starts
+    from the same game_rng(seed, game), so the candidates differ only in
+    their own decisions.
+
+    Args:
+      task (tuple): (seed, first deal, last deal + 1, candidates, number of
+              players, antithetic, num_cards, offset, dis)
+
+    Returns:
+      list: per deal, per candidate, (mean reward, mean score) over the
+            seats (and twins) it was played from
+    """
+    seed, start, stop, candidates, num_players, antithetic, num_cards, \
+        offset, dis = task
+    results = []
+    mytable = None
+    for deal in range(start, stop):
+        orders = deal_orders(random.Random("{}:deal:{}".format(seed, deal)), \
+                             num_cards, offset, antithetic)
+        outcome = []
+        for candidate in candidates:
+            reward = 0.0
+            score = 0.0
+            for twin, order in enumerate(orders):
+                for pos in range(num_players):
+                    game = (deal * len(orders) + twin) * num_players + pos
+                    players = [make_player(candidate, pos)]
+                    rng = game_rng(seed, game)
+                    if mytable is None:
+                        mytable = Table(players=players, \
+                                        num_ai_players=num_players - 1, \
+                                        verbose=0, rng=rng, \
+                                        deck=Deck(num_cards, offset, dis, \
+                                                  order=order))
+                    else:
+                        mytable.deck.reset(order=order)
+                        mytable.reset(deck=mytable.deck, players=players, \
+                                      rng=rng)
+                    mytable.play()
+                    features = mytable.score()[pos]
+                    reward += (0.0, 1.0, 0.5)[features[0]]
+                    score += features[1]
+            games = len(orders) * num_players
+            outcome.append((reward / games, score / games))
+        results.append(outcome)
+    return results
+
+
+class PairedResult(object):
+    """Paired comparison of two candidates.
+
+    Every statistic is over deals: the difference of a deal is that of the
+    two candidates' mean results on it, over all seats (and antithetic
+    twins), so deck and seat luck cancel out of it.
+
+    Attributes:
+      reward (tuple): Moments of each candidate's win share per deal
+      score (tuple): Moments of each candidate's score per deal
+      reward_diff (Moments): first minus second candidate's win share
+      score_diff (Moments): first minus second candidate's score
+      games (int): games played
+
+    Methods:
+      add()
+      merge()
+      variance_reduction()
+    """
+
+    def __init__(self):
+        self.reward = (Moments(), Moments())
+        self.score = (Moments(), Moments())
+        self.reward_diff = Moments()
+        self.score_diff = Moments()
+        self.games = 0
+
+    def add(self, outcome, games):
+        """Add one deal's ((reward, score), (reward, score))."""
+        for moments, (reward, score) in zip(zip(self.reward, self.score), \
+                                            outcome):
+            moments[0].add(reward)
+            moments[1].add(score)
+        self.reward_diff.add(outcome[0][0] - outcome[1][0])
+        self.score_diff.add(outcome[0][1] - outcome[1][1])
+        self.games += games
+
+    def merge(self, other):
+        for mine, theirs in zip(self.reward + self.score, \
+                                other.reward + other.score):
+            mine.merge(theirs)
+        self.reward_diff.merge(other.reward_diff)
+        self.score_diff.merge(other.score_diff)
+        self.games += other.games
+        return self
+
+    def variance_reduction(self, what='score'):
+        """
+        Variance of the difference if the two candidates had played
+        independent deals, over that of the paired difference: the factor
+        by which pairing cuts the deals needed for a given confidence.
+        """
+        first, second = getattr(self, what)
+        paired = getattr(self, what + '_diff').variance
+        if paired == 0:
+            return float('inf')
+        return (first.variance + second.variance) / paired
+
+
+def compare(first, second, num_deals=1000, num_players=3, seed=0, \
+            antithetic=False, workers=None, chunk=None, num_cards=33, \
+            offset=3, dis=9):
+    """
+    Compare two candidates on the same deals (common random numbers).
+
+    Each deal is played num_players times by each candidate, once from
+    every seat, against the same randomized opponents, and with antithetic
+    twice as often, on the deck and on its antithetic twin (see
+    deal_orders()).
+
+    Args:
+      first, second: candidates, as threshold tuples (see Player) or
+              callables returning the Player for a given pos
+      num_deals (int): number of deals
+      num_players (int): players per table, the candidate included
+      seed: seed of the deals and of the games
+      antithetic (bool): also play every deal's antithetic twin
+      workers (int): worker processes (default: one per CPU)
+      chunk (int): deals handed to a worker at a time
+      num_cards, offset, dis: the deck, as for Table
+
+    Returns:
+      PairedResult
+    """
+    if workers is None:
+        workers = os.cpu_count() or 1
+    if chunk is None:
+        chunk = max(1, min(200, num_deals // (4 * workers)))
+    candidates = (first, second)
+    tasks = [(seed, start, min(start + chunk, num_deals), candidates, \
+              num_players, antithetic, num_cards, offset, dis) \
+             for start in range(0, num_deals, chunk)]
+    games = 2 * num_players * (2 if antithetic else 1)
+    result = PairedResult()
+    if workers == 1:
+        blocks = map(play_deals, tasks)
+    else:
+        pool = Pool(workers)
+        blocks = pool.imap(play_deals, tasks)
+    try:
+        for block in blocks:
+            for outcome in block:
+                result.add(outcome, games)
+    finally:
+        if workers > 1:
+            pool.close()
+            pool.join()
+    return result
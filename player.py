@@ -1,4 +1,4 @@
-import sys
+from strategy import ThresholdStrategy
 
 class Player(object):
     """Define a player by her attributes (risk thresholds) and actions
@@ -7,10 +7,15 @@ class Player(object):
       pos (int): Position in play order (indexed from 0)
       win (int): 
       tokens (int): Number of tokens in the player's possession.
+      cards (List[int]): Cards in the order in which they were obtained.
+      hand (int): Bitmask of the cards in hand (bit n set if card n is held).
+      head_sum (int): Sum of the lowest card of each run in hand.
+      num_runs (int): Number of runs in hand.
+      strategy (Strategy): the player's policy (see strategy.py)
     """
 
     def __init__(self, pos, init_threshold=9, eff_val_threshold=0, \
-                 token_threshold=0, pot_threshold=8):
+                 token_threshold=0, pot_threshold=8, strategy=None):
         """
         Args:
           pos (int): Position in play order (starting from 0)
@@ -26,22 +31,47 @@ class Player(object):
                   card.
           pot_threshold (int): Min number of tokens in the pot that will entice
                   the player to take the card, regardless of effective value.
+          strategy (Strategy): the player's policy (default:
+                  ThresholdStrategy, which plays by the thresholds above)
         """
         self.pos = pos
+        self.set_thresholds(init_threshold, eff_val_threshold, \
+                            token_threshold, pot_threshold)
+        self.strategy = ThresholdStrategy() if strategy is None else strategy
+        self.reset()
+
+    def set_thresholds(self, init_threshold, eff_val_threshold, \
+                       token_threshold, pot_threshold):
+        """
+        Set the risk thresholds (see __init__()).
+
+        Raises:
+          ValueError: if token_threshold is not 0-10
+        """
+        # Do not allow a token_threshold of 11: player will take all the cards.
+        if token_threshold > 10 or token_threshold < 0:
+            raise ValueError("token_threshold must be 0-10")
+        self.init_threshold = init_threshold
+        self.eff_val_threshold = eff_val_threshold
+        self.token_threshold = token_threshold
+        self.pot_threshold = pot_threshold
+
+    def reset(self):
+        """
+        Get ready for a new game: 11 tokens, no cards. The thresholds and
+        strategy are kept.
+
+        The lists of the last game are replaced rather than cleared, since
+        Table.score() hands them out.
+        """
         self.tokens = 11
         self.cards = []
+        self.hand = 0
         self.score = 0
         self.eff_val = 0
-        self.init_threshold = init_threshold
-        # Do not allow a token_threshold of 11: player will take all the cards.
-        if token_threshold > 10 or token_threshold < 0:
-            sys.exit("token_threshold must be 0-10")
-        else:
-            self.token_threshold = token_threshold
-        self.pot_threshold = pot_threshold
-        self.eff_val_threshold = eff_val_threshold
         self.win = 0
         self.num_runs = 0
+        self.head_sum = 0
         self.token_history = [ 11 ]
         self.eff_val_history = []
 
@@ -50,9 +80,32 @@ class Player(object):
             self.tokens -= 1
             self.token_history.append(self.tokens)
         else:
-            sys.exit("Played an imaginary token!")
+            raise RuntimeError("Played an imaginary token!")
+
+    def explain(self, table):
+        """
+        Decide whether to take table.card_up, according to the player's
+        strategy. Table asks only while the player holds tokens (see
+        Table.decide()), so this is the one method to override to change
+        how a player plays without a Strategy.
+
+        Returns:
+          tuple: (True to take or False to pass, name of the rule that
+                 made the decision, see Strategy.explain())
+        """
+        return self.strategy.explain(table, self)
 
     def take_card(self, card, pot):
+        hand = self.hand
+        # Keep the run heads (see get_score()) up to date: card starts a
+        # run unless card - 1 is held, and card + 1 no longer does.
+        if not (hand >> (card - 1)) & 1:
+            self.head_sum += card
+            self.num_runs += 1
+        if (hand >> (card + 1)) & 1:
+            self.head_sum -= card + 1
+            self.num_runs -= 1
+        self.hand = hand | 1 << card
         self.cards.append(card)
         self.tokens += pot
         self.token_history.append(self.tokens)
@@ -61,23 +114,14 @@ class Player(object):
     def get_score(self):
         """
         Calculate the player's current score.
+
+        The lowest card of each run is a card whose predecessor is not in
+        hand. take_card() keeps the sum of those run heads (head_sum) and
+        their number (num_runs), so the score is their sum less the
+        tokens, in constant time however many cards are held.
         """
-        cards = list(sorted(self.cards))
-        tot = 0
-        self.num_runs = 0
-        if len(cards) == 0:
+        if self.hand == 0:
             self.score = 0
         else:
-            low = cards.pop(0)
-            prev = low
-            self.num_runs = 1
-            while len(cards) > 0:
-                current = cards.pop(0)
-                if current > prev + 1:
-                    tot += low
-                    low = current
-                    self.num_runs += 1
-                prev = current
-            tot += low
-            self.score = tot - self.tokens
+            self.score = self.head_sum - self.tokens
         return self.score
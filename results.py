@@ -0,0 +1,204 @@
+import os
+import numpy as np
+
+# Fixed-width columns, one row per player per game, in Table.score() order.
+SCALARS = (
+    ('win', np.int8),
+    ('score', np.int16),
+    ('pos', np.int16),
+    ('init_threshold', np.int16),
+    ('token_threshold', np.int16),
+    ('eff_val_threshold', np.int16),
+    ('pot_threshold', np.int16),
+)
+
+# Variable-length columns, stored as a flat value array plus an offset
+# array: row i holds values[offsets[i]:offsets[i + 1]].
+HISTORIES = (
+    ('token_history', np.int16),
+    ('eff_val_history', np.float32),
+    ('cards', np.int16),
+)
+
+
+class ResultsWriter(object):
+    """Columnar, streaming sink for Table.score() results.
+
+    Each finished game is copied straight into preallocated column buffers.
+    When a chunk of rows is full it is written to its own directory of .npy
+    files, one file per column, and the buffers are reused, so memory use
+    does not grow with the number of games. Chunks are read back
+    memory-mapped with iter_chunks(), or joined with load_results().
+
+    Methods:
+      add()
+      flush()
+      close()
+    """
+
+    def __init__(self, path, chunk=65536):
+        """
+        Args:
+          path (str): output directory, new or empty
+          chunk (int): number of rows (players) per chunk on disk
+
+        Raises:
+          ValueError: if path already holds files, e.g. an earlier run:
+                  its chunks would be overwritten in part, and mixed with
+                  this run's by load_results()
+        """
+        if os.path.isdir(path) and os.listdir(path):
+            raise ValueError("{} is not empty".format(path))
+        os.makedirs(path, exist_ok=True)
+        self.path = path
+        self.chunk = chunk
+        self.num_chunks = 0
+        self.num_games = 0
+        self.rows = 0
+        self.game = np.zeros(chunk, dtype=np.int64)
+        self.scalars = {name: np.zeros(chunk, dtype=dtype) \
+                        for name, dtype in SCALARS}
+        self.offsets = {name: np.zeros(chunk + 1, dtype=np.int64) \
+                        for name, dtype in HISTORIES}
+        self.values = {name: np.zeros(16 * chunk, dtype=dtype) \
+                       for name, dtype in HISTORIES}
+
+    def add(self, features):
+        """
+        Append one game.
+
+        Args:
+          features: the list returned by Table.score() with verbose=0
+
+        Raises:
+          ValueError: if a value does not fit its column (e.g. a score
+                  beyond int16, from a very large deck); the game is not
+                  added
+        """
+        if self.rows + len(features) > self.chunk:
+            self.flush()
+        first = self.rows
+        try:
+            self.add_rows(features)
+        except OverflowError as error:
+            self.rows = first
+            raise ValueError("Game does not fit the results columns: {}"\
+                             .format(error))
+        self.num_games += 1
+
+    def add_rows(self, features):
+        """Copy the rows of one game into the buffers (see add())."""
+        for player in features:
+            row = self.rows
+            self.game[row] = self.num_games
+            for col, (name, dtype) in enumerate(SCALARS):
+                self.scalars[name][row] = player[col]
+            for col, (name, dtype) in enumerate(HISTORIES, len(SCALARS)):
+                history = player[col]
+                offsets = self.offsets[name]
+                start = offsets[row]
+                stop = start + len(history)
+                values = self.values[name]
+                if stop > len(values):
+                    values = np.resize(values, 2 * stop)
+                    self.values[name] = values
+                values[start:stop] = history
+                offsets[row + 1] = stop
+            self.rows += 1
+
+    def flush(self):
+        """Write the buffered rows as a new chunk and empty the buffers."""
+        if self.rows == 0:
+            return
+        rows = self.rows
+        chunk_dir = os.path.join(self.path, '{:06d}'.format(self.num_chunks))
+        os.makedirs(chunk_dir, exist_ok=True)
+        np.save(os.path.join(chunk_dir, 'game.npy'), self.game[:rows])
+        for name, dtype in SCALARS:
+            np.save(os.path.join(chunk_dir, name + '.npy'), \
+                    self.scalars[name][:rows])
+        for name, dtype in HISTORIES:
+            offsets = self.offsets[name][:rows + 1]
+            np.save(os.path.join(chunk_dir, name + '_offsets.npy'), offsets)
+            np.save(os.path.join(chunk_dir, name + '.npy'), \
+                    self.values[name][:offsets[-1]])
+            self.offsets[name][0] = 0
+        self.num_chunks += 1
+        self.rows = 0
+
+    def close(self):
+        self.flush()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def iter_chunks(path):
+    """
+    Yield the chunks written by ResultsWriter, in order, as dicts of
+    memory-mapped columns (see load_results()).
+
+    Nothing is read into memory until it is used: this is the way to go
+    through a run of any size.
+    """
+    for entry in sorted(os.listdir(path)):
+        chunk_dir = os.path.join(path, entry)
+        if not os.path.isdir(chunk_dir):
+            continue
+        columns = {}
+        for name in ['game'] + [name for name, dtype in SCALARS]:
+            columns[name] = np.load(os.path.join(chunk_dir, name + '.npy'), \
+                                    mmap_mode='r')
+        for name, dtype in HISTORIES:
+            columns[name] = np.load(os.path.join(chunk_dir, name + '.npy'), \
+                                    mmap_mode='r')
+            columns[name + '_offsets'] = np.load(
+                os.path.join(chunk_dir, name + '_offsets.npy'), mmap_mode='r')
+        yield columns
+
+
+def load_results(path):
+    """
+    Load a whole run written by ResultsWriter as single columns.
+
+    A single chunk is returned memory-mapped, without copying. Several
+    chunks are concatenated into memory, with history offsets rebased onto
+    the combined value arrays, so this copies the whole run: for large runs
+    use iter_chunks() instead. An empty run gives empty columns.
+
+    Returns:
+      dict: 'game' and the SCALARS columns, one entry per row; for each of
+            the HISTORIES, the flat values and '<name>_offsets'
+    """
+    chunks = list(iter_chunks(path))
+    if len(chunks) == 1:
+        return chunks[0]
+    if not chunks:
+        columns = {'game': np.zeros(0, dtype=np.int64)}
+        for name, dtype in SCALARS + HISTORIES:
+            columns[name] = np.zeros(0, dtype=dtype)
+        for name, dtype in HISTORIES:
+            columns[name + '_offsets'] = np.zeros(1, dtype=np.int64)
+        return columns
+    columns = {}
+    for name in ['game'] + [name for name, dtype in SCALARS]:
+        columns[name] = np.concatenate([chunk[name] for chunk in chunks])
+    for name, dtype in HISTORIES:
+        columns[name] = np.concatenate([chunk[name] for chunk in chunks])
+        offsets = [np.zeros(1, dtype=np.int64)]
+        base = 0
+        for chunk in chunks:
+            offsets.append(chunk[name + '_offsets'][1:] + base)
+            base += len(chunk[name])
+        columns[name + '_offsets'] = np.concatenate(offsets)
+    return columns
+
+
+def to_dataframe(columns):
+    """Return the scalar columns of load_results() as a pandas DataFrame."""
+    import pandas as pd
+    return pd.DataFrame({name: columns[name] for name in \
+                         ['game'] + [name for name, dtype in SCALARS]})
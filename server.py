@@ -0,0 +1,507 @@
+import os
+import sys
+import json
+import time
+import random
+import asyncio
+import argparse
+import traceback
+from player import Player
+from table import Table
+from events import Pass, Take, CardDrawn
+
+# Protocol: one JSON object per line, in both directions.
+#
+# client -> server
+#   {"type": "join", "players": 3, "remote": 1}
+#       Take a seat at the next table of that many players with that many
+#       client seats (the rest are bots). The table starts once full.
+#       players is at most the server's max_players.
+#   {"type": "move", "take": true}
+#       Answer to a "turn": take the card (true) or pass (false).
+#
+# server -> client
+#   {"type": "seated", "table": id, "pos": k, "players": n}
+#   {"type": "card", "card": c, "remaining": r}     a card is turned up
+#   {"type": "pass", "pos": k, "card": c, "pot": p}  pot after the pass
+#   {"type": "take", "pos": k, "card": c, "pot": p}  pot taken with it
+#   {"type": "turn", "card": c, "pot": p, "tokens": t, "hands": [[...]],
+#    "timeout": s}
+#       The client's move, within timeout seconds. If it does not answer
+#       in time (or has disconnected), its seat's ThresholdStrategy moves
+#       for it.
+#   {"type": "over", "scores": [...], "win": w}       w as Table.score()
+#   {"type": "error", "message": "..."}
+#       Also ends the game for the client if its table fails.
+#
+# Addresses are "host:port" for TCP, anything else is a Unix socket path.
+
+
+def parse_address(address):
+    """(host, port) of a TCP address, or None for a Unix socket path."""
+    host, sep, port = address.rpartition(':')
+    if sep and port.isdigit() and os.sep not in address:
+        return host or '127.0.0.1', int(port)
+    return None
+
+
+async def open_connection(address):
+    tcp = parse_address(address)
+    if tcp:
+        return await asyncio.open_connection(*tcp)
+    return await asyncio.open_unix_connection(address)
+
+
+def send(writer, message):
+    writer.write(json.dumps(message).encode() + b'\n')
+
+
+class Seat(object):
+    """A client's seat at a table.
+
+    Messages to the client are buffered and written together by flush(),
+    when the client has to answer and when the game is over, so the moves
+    of the bots between two of its turns cost one write.
+
+    Attributes:
+      writer (asyncio.StreamWriter): the client's connection
+      pos (int): position at the table, once seated
+      move (asyncio.Future): pending answer to a "turn", if any; None
+              as its result means the client has gone
+      playing (bool): True from joining until the game is over
+      connected (bool): False once the client has gone
+    """
+
+    def __init__(self, writer):
+        self.writer = writer
+        self.pos = None
+        self.move = None
+        self.playing = True
+        self.connected = True
+        self.buffer = []
+
+    def send(self, message):
+        if self.connected:
+            self.buffer.append(json.dumps(message))
+
+    async def flush(self):
+        """Write the buffered messages, waiting if the client lags."""
+        if self.connected and self.buffer:
+            self.buffer.append('')
+            self.writer.write('\n'.join(self.buffer).encode())
+            self.buffer = []
+            try:
+                await self.writer.drain()
+            except ConnectionError:
+                self.connected = False
+
+
+def expire(move):
+    """Time a client's move out (see GameServer.ask())."""
+    if not move.done():
+        move.set_result(None)
+
+
+class GameServer(object):
+    """Hosts any number of concurrent tables for remote clients.
+
+    Every table runs as its own task. Bot moves are plain Table.step()
+    calls, a few microseconds each, and a table hands the event loop back
+    after every yield_every of them and whenever it waits for a client,
+    so no table holds up the others.
+
+    Attributes:
+      games (int): tables finished
+      failures (int): tables that stopped on an error
+      moves (int): client moves received
+      timeouts (int): client moves made by the fallback strategy
+
+    Methods:
+      handle()
+      join()
+      run_table()
+      play_table()
+      start()
+    """
+
+    def __init__(self, move_timeout=10.0, yield_every=16, rng=None, \
+                 max_players=12):
+        """
+        Args:
+          move_timeout (float): seconds a client has to answer a "turn"
+          yield_every (int): bot moves between yields to the event loop
+          rng (random.Random): source of the tables' random streams
+          max_players (int): most players a client may ask for at a table;
+                  a table is set up in one go, so this bounds the time it
+                  holds the event loop
+        """
+        self.move_timeout = move_timeout
+        self.yield_every = yield_every
+        self.rng = random.Random() if rng is None else rng
+        self.max_players = max_players
+        # Seats waiting for their table to fill, by (players, remote).
+        self.lobby = {}
+        self.tables = set()
+        self.num_tables = 0
+        self.games = 0
+        self.failures = 0
+        self.moves = 0
+        self.timeouts = 0
+
+    async def handle(self, reader, writer):
+        """Serve one client connection."""
+        seat = None
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                try:
+                    message = json.loads(line)
+                    kind = message['type']
+                except (ValueError, KeyError, TypeError):
+                    send(writer, {'type': 'error', \
+                                  'message': "bad message"})
+                    continue
+                if kind == 'join':
+                    if seat is not None and seat.playing:
+                        send(writer, {'type': 'error', \
+                                      'message': "already playing"})
+                        continue
+                    seat = Seat(writer)
+                    self.join(seat, message)
+                elif kind == 'move':
+                    if seat is None or seat.move is None \
+                       or seat.move.done():
+                        send(writer, {'type': 'error', \
+                                      'message': "not your turn"})
+                        continue
+                    self.moves += 1
+                    seat.move.set_result(bool(message.get('take')))
+                else:
+                    send(writer, {'type': 'error', \
+                                  'message': "unknown type {}".format(kind)})
+        except ConnectionError:
+            pass
+        finally:
+            if seat is not None:
+                seat.connected = False
+                if seat.move is not None and not seat.move.done():
+                    seat.move.set_result(None)
+            writer.close()
+
+    def join(self, seat, message):
+        """Put seat in the lobby; start a table once enough have joined."""
+        try:
+            num_players = int(message.get('players', 3))
+            remote = int(message.get('remote', 1))
+        except (ValueError, TypeError):
+            num_players, remote = 0, 0
+        if not 1 <= num_players <= self.max_players \
+           or not 1 <= remote <= num_players:
+            send(seat.writer, {'type': 'error', \
+                               'message': "players must be 1-{}, remote "
+                                          "1-players".format(self.max_players)})
+            seat.playing = False
+            return
+        waiting = self.lobby.setdefault((num_players, remote), [])
+        waiting.append(seat)
+        if len(waiting) == remote:
+            del self.lobby[(num_players, remote)]
+            task = asyncio.ensure_future(self.run_table(waiting, num_players))
+            self.tables.add(task)
+            task.add_done_callback(self.tables.discard)
+
+    async def run_table(self, seats, num_players):
+        """
+        Play one game (see play_table()). If it fails, the error is
+        printed and every seat is told, so no client waits for a game that
+        will never end.
+        """
+        try:
+            await self.play_table(seats, num_players)
+        except Exception:
+            self.failures += 1
+            traceback.print_exc()
+            for seat in seats:
+                seat.send({'type': 'error', 'message': "table failed"})
+                seat.playing = False
+                await seat.flush()
+
+    async def play_table(self, seats, num_players):
+        """Play one game, asking seats for their moves."""
+        table_id = self.num_tables
+        self.num_tables += 1
+        rng = random.Random(self.rng.getrandbits(64))
+        positions = rng.sample(range(num_players), len(seats))
+        by_pos = {}
+        for seat, pos in zip(seats, positions):
+            seat.pos = pos
+            by_pos[pos] = seat
+            seat.send({'type': 'seated', 'table': table_id, 'pos': pos, \
+                       'players': num_players})
+
+        def broadcast(event):
+            kind = type(event)
+            if kind is Pass:
+                message = {'type': 'pass', 'pos': event.pos, \
+                           'card': event.card, 'pot': event.pot}
+            elif kind is Take:
+                message = {'type': 'take', 'pos': event.pos, \
+                           'card': event.card, 'pot': event.pot}
+            elif kind is CardDrawn:
+                message = {'type': 'card', 'card': event.card, \
+                           'remaining': event.remaining}
+            else:
+                return
+            for seat in seats:
+                seat.send(message)
+
+        mytable = Table(players=[Player(pos) for pos in positions], \
+                        num_ai_players=num_players - len(seats), verbose=0, \
+                        rng=rng, subscribers=[broadcast])
+        # Clients hear of the first card before any turn.
+        mytable.start()
+        steps = 0
+        while not mytable.game_over:
+            seat = by_pos.get(mytable.whose_turn)
+            player = mytable.players[mytable.whose_turn]
+            if seat is None or player.tokens == 0:
+                mytable.step()
+                steps += 1
+                if steps % self.yield_every == 0:
+                    await asyncio.sleep(0)
+                continue
+            player.eff_val = mytable.effective_value(mytable.whose_turn)
+            if await self.ask(seat, mytable, player):
+                mytable.player_takes_card()
+            else:
+                mytable.player_passes()
+        scores = []
+        for player in mytable.players:
+            scores.append(player.get_score())
+        low = min(scores)
+        winners = scores.count(low)
+        for seat in seats:
+            win = 0 if scores[seat.pos] != low else 1 if winners == 1 else 2
+            seat.send({'type': 'over', 'scores': scores, 'win': win})
+            seat.playing = False
+            await seat.flush()
+        self.games += 1
+
+    async def ask(self, seat, table, player):
+        """The seat's move: its client's answer, or its fallback's."""
+        if seat.connected:
+            seat.move = asyncio.get_running_loop().create_future()
+            seat.send({'type': 'turn', 'card': table.card_up, \
+                       'pot': table.pot, 'tokens': player.tokens, \
+                       'hands': [sorted(other.cards) \
+                                 for other in table.players], \
+                       'timeout': self.move_timeout})
+            await seat.flush()
+            # A timer is much cheaper than asyncio.wait_for().
+            timer = asyncio.get_running_loop().call_later(
+                self.move_timeout, expire, seat.move)
+            take = await seat.move
+            timer.cancel()
+            seat.move = None
+            if take is not None:
+                return take
+        self.timeouts += 1
+        return player.explain(table)[0]
+
+    async def start(self, address, backlog=4096):
+        """Start listening on address. Returns the asyncio server."""
+        tcp = parse_address(address)
+        if tcp:
+            return await asyncio.start_server(self.handle, *tcp, \
+                                              backlog=backlog)
+        return await asyncio.start_unix_server(self.handle, address, \
+                                               backlog=backlog)
+
+
+async def serve(address, move_timeout=10.0, max_players=12):
+    """Run a GameServer on address until cancelled."""
+    server = await GameServer(move_timeout, max_players=max_players)\
+        .start(address)
+    async with server:
+        await server.serve_forever()
+
+
+def percentile(values, q):
+    """q-th percentile (0-100) of sorted values, nearest rank."""
+    if not values:
+        return float('nan')
+    return values[min(len(values) - 1, int(q / 100.0 * len(values)))]
+
+
+async def synthetic_client(address, games, num_players, remote, latencies, \
+                           errors, stall=0.0, rng=None, failures=None):
+    """
+    A client playing games games with a simple rule (take if the card is
+    worth at most 10 after the pot), recording the time from each of its
+    moves to the server's report of it, in seconds, and the server's error
+    messages. An error other than a late move ("not your turn") ends the
+    game, which is then recorded in failures instead of completed.
+
+    Args:
+      stall (float): chance of not answering a turn, to exercise timeouts
+
+    Returns:
+      int: games completed
+    """
+    rng = random.Random() if rng is None else rng
+    reader, writer = await open_connection(address)
+    done = 0
+    try:
+        for game in range(games):
+            send(writer, {'type': 'join', 'players': num_players, \
+                          'remote': remote})
+            pos = None
+            sent = None
+            while True:
+                line = await reader.readline()
+                if not line:
+                    return done
+                message = json.loads(line)
+                kind = message['type']
+                if kind == 'seated':
+                    pos = message['pos']
+                elif kind == 'turn':
+                    if rng.random() < stall:
+                        continue
+                    take = message['card'] - message['pot'] <= 10
+                    sent = time.perf_counter()
+                    send(writer, {'type': 'move', 'take': take})
+                elif kind in ('pass', 'take') and message['pos'] == pos \
+                        and sent is not None:
+                    latencies.append(time.perf_counter() - sent)
+                    sent = None
+                elif kind == 'over':
+                    done += 1
+                    break
+                elif kind == 'error':
+                    errors.append(message['message'])
+                    if message['message'] != "not your turn":
+                        # A rejected join or a failed table: no "over"
+                        # is coming.
+                        if failures is not None:
+                            failures.append(message['message'])
+                        break
+    finally:
+        writer.close()
+    return done
+
+
+async def load_test(address, clients=100, games=10, num_players=3, \
+                    remote=1, stall=0.0, seed=0):
+    """
+    Drive a server with synthetic clients, all at once.
+
+    Returns:
+      dict: tables and moves per second, games that failed, and move
+            latency percentiles in milliseconds
+    """
+    latencies = []
+    errors = []
+    failures = []
+    start = time.perf_counter()
+    played = await asyncio.gather(*[
+        synthetic_client(address, games, num_players, remote, latencies, \
+                         errors, stall, \
+                         random.Random("{}:{}".format(seed, i)), failures) \
+        for i in range(clients)])
+    elapsed = time.perf_counter() - start
+    latencies.sort()
+    report = {'clients': clients, 'tables': sum(played) // remote, \
+              'moves': len(latencies), 'errors': len(errors), \
+              'failures': len(failures), \
+              'seconds': elapsed, \
+              'tables_per_sec': sum(played) / remote / elapsed, \
+              'moves_per_sec': len(latencies) / elapsed}
+    for q in (50, 90, 99, 99.9):
+        report['p{}_ms'.format(q)] = 1000 * percentile(latencies, q)
+    report['max_ms'] = 1000 * latencies[-1] if latencies else float('nan')
+    return report
+
+
+def run_server(address, move_timeout, max_players=12):
+    """Entry point of a server process."""
+    try:
+        asyncio.run(serve(address, move_timeout, max_players))
+    except KeyboardInterrupt:
+        pass
+
+
+def wait_for_server(address, timeout=5.0):
+    """Wait until a server accepts connections on address."""
+    async def probe():
+        reader, writer = await open_connection(address)
+        writer.close()
+    deadline = time.perf_counter() + timeout
+    while True:
+        try:
+            return asyncio.run(probe())
+        except OSError:
+            if time.perf_counter() > deadline:
+                raise
+            time.sleep(0.01)
+
+
+def local_load_test(clients=100, games=10, num_players=3, remote=1, \
+                    stall=0.0, move_timeout=1.0, seed=0, max_players=12):
+    """
+    load_test() against a server started in a child process on a temporary
+    Unix socket, so the clients do not share its event loop.
+    """
+    import tempfile
+    from multiprocessing import Process
+    directory = tempfile.mkdtemp()
+    address = os.path.join(directory, 'nothx.sock')
+    server = Process(target=run_server, \
+                     args=(address, move_timeout, max_players), daemon=True)
+    server.start()
+    try:
+        wait_for_server(address)
+        return asyncio.run(load_test(address, clients, games, num_players, \
+                                     remote, stall, seed))
+    finally:
+        server.terminate()
+        server.join()
+        if os.path.exists(address):
+            os.remove(address)
+        os.rmdir(directory)
+
+
+def print_report(report):
+    print("{0} tables, {1} client moves in {2:.2f} s: {3:.0f} tables/s, "
+          "{4:.0f} moves/s".format(report['tables'], report['moves'], \
+                                   report['seconds'], report['tables_per_sec'], \
+                                   report['moves_per_sec']))
+    print("move latency (ms): p50 {0:.2f}  p90 {1:.2f}  p99 {2:.2f}  "
+          "p99.9 {3:.2f}  max {4:.2f}"\
+          .format(report['p50_ms'], report['p90_ms'], report['p99_ms'], \
+                  report['p99.9_ms'], report['max_ms']))
+    if report['failures']:
+        print("{0} games failed (join rejected or table failed)"\
+              .format(report['failures']))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="No Thanks game server")
+    parser.add_argument('-a', '--address', default='127.0.0.1:7433', \
+                        help="host:port, or a Unix socket path")
+    parser.add_argument('-t', '--timeout', type=float, default=10.0, \
+                        help="seconds a client has for each move")
+    parser.add_argument('-m', '--max-players', type=int, default=12, \
+                        help="most players per table (default 12)")
+    args = parser.parse_args(argv)
+    try:
+        asyncio.run(serve(args.address, args.timeout, args.max_players))
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
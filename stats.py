@@ -0,0 +1,193 @@
+import math
+
+# Threshold features of Table.score(), by column index.
+THRESHOLD_COLUMNS = (
+    ('init_threshold', 3),
+    ('token_threshold', 4),
+    ('eff_val_threshold', 5),
+    ('pot_threshold', 6),
+)
+
+
+class Counter(object):
+    """Integer-keyed counts. Mergeable."""
+
+    def __init__(self):
+        self.counts = {}
+        self.total = 0
+
+    def add(self, key, n=1):
+        self.counts[key] = self.counts.get(key, 0) + n
+        self.total += n
+
+    def merge(self, other):
+        for key, n in other.counts.items():
+            self.add(key, n)
+        return self
+
+    def frequency(self, key):
+        """Fraction of the total counted under key."""
+        return self.counts.get(key, 0) / self.total if self.total else 0.0
+
+    def mean(self):
+        """Mean of the keys, weighted by their counts."""
+        return sum(key * n for key, n in self.counts.items()) / self.total \
+            if self.total else 0.0
+
+
+class Moments(object):
+    """Running count, mean and variance (Welford). Mergeable."""
+
+    def __init__(self):
+        self.n = 0
+        self.mean = 0.0
+        self.m2 = 0.0
+
+    def add(self, x):
+        self.n += 1
+        delta = x - self.mean
+        self.mean += delta / self.n
+        self.m2 += delta * (x - self.mean)
+
+    def merge(self, other):
+        """Combine with another Moments (Chan et al. parallel update)."""
+        n = self.n + other.n
+        if n == 0:
+            return self
+        delta = other.mean - self.mean
+        self.mean += delta * other.n / n
+        self.m2 += other.m2 + delta * delta * self.n * other.n / n
+        self.n = n
+        return self
+
+    @property
+    def variance(self):
+        """Sample variance (0 for fewer than two values)."""
+        return self.m2 / (self.n - 1) if self.n > 1 else 0.0
+
+    @property
+    def std(self):
+        return math.sqrt(self.variance)
+
+    @property
+    def sem(self):
+        """Standard error of the mean."""
+        return math.sqrt(self.variance / self.n) if self.n > 0 else 0.0
+
+
+class WinRate(object):
+    """Games played and won (ties counted separately) per key. Mergeable."""
+
+    def __init__(self):
+        self.games = Counter()
+        self.wins = Counter()
+        self.ties = Counter()
+
+    def add(self, key, win):
+        """
+        Args:
+          key: e.g. a threshold value or a position
+          win (int): the Table.score() win field (0 lost, 1 won, 2 tied)
+        """
+        self.games.add(key)
+        if win == 1:
+            self.wins.add(key)
+        elif win == 2:
+            self.ties.add(key)
+
+    def merge(self, other):
+        self.games.merge(other.games)
+        self.wins.merge(other.wins)
+        self.ties.merge(other.ties)
+        return self
+
+    def rate(self, key, ties=True):
+        """Fraction of games at key that were won (or tied, if ties)."""
+        games = self.games.counts.get(key, 0)
+        if games == 0:
+            return 0.0
+        won = self.wins.counts.get(key, 0)
+        if ties:
+            won += self.ties.counts.get(key, 0)
+        return won / games
+
+    def table(self, ties=True):
+        """List of (key, games, win rate), sorted by key."""
+        return [(key, self.games.counts[key], self.rate(key, ties)) \
+                for key in sorted(self.games.counts)]
+
+
+class StrategyStats(object):
+    """Streaming summary of the statistics studied in analysis.ipynb.
+
+    Each Table.score() result (verbose=0) is folded in by add() and then
+    dropped, so arbitrarily long simulations run in constant memory.
+    Instances built in parallel workers combine with merge().
+
+    Attributes:
+      games (int): number of games added
+      hand_length (dict): Counter of final hand sizes, for 'win' (won or
+              tied) and 'lose'
+      card_frequency (dict): Counter of cards in final hands, for 'win' and
+              'lose'; divide by hands[...] for the fraction of hands
+      hands (dict): number of hands, for 'win' and 'lose'
+      score (dict): Moments of the final score, for 'win' and 'lose'
+      position (WinRate): win rate by pos
+      thresholds (dict): for each threshold name, a dict with a WinRate by
+              threshold value ('rate') and Counters of the values held by
+              winners and losers ('win', 'lose')
+
+    Methods:
+      add()
+      merge()
+    """
+
+    def __init__(self):
+        self.games = 0
+        self.hands = {'win': 0, 'lose': 0}
+        self.hand_length = {'win': Counter(), 'lose': Counter()}
+        self.card_frequency = {'win': Counter(), 'lose': Counter()}
+        self.score = {'win': Moments(), 'lose': Moments()}
+        self.position = WinRate()
+        self.thresholds = {}
+        for name, col in THRESHOLD_COLUMNS:
+            self.thresholds[name] = {'rate': WinRate(), 'win': Counter(), \
+                                     'lose': Counter()}
+
+    def add(self, features):
+        """
+        Fold in one game.
+
+        Args:
+          features: the list returned by Table.score() with verbose=0
+        """
+        self.games += 1
+        for player in features:
+            win = player[0]
+            outcome = 'win' if win > 0 else 'lose'
+            cards = player[9]
+            self.hands[outcome] += 1
+            self.hand_length[outcome].add(len(cards))
+            card_frequency = self.card_frequency[outcome]
+            for card in cards:
+                card_frequency.add(card)
+            self.score[outcome].add(player[1])
+            self.position.add(player[2], win)
+            for name, col in THRESHOLD_COLUMNS:
+                threshold = self.thresholds[name]
+                threshold['rate'].add(player[col], win)
+                threshold[outcome].add(player[col])
+
+    def merge(self, other):
+        """Combine with the statistics of another StrategyStats."""
+        self.games += other.games
+        for outcome in ('win', 'lose'):
+            self.hands[outcome] += other.hands[outcome]
+            self.hand_length[outcome].merge(other.hand_length[outcome])
+            self.card_frequency[outcome].merge(other.card_frequency[outcome])
+            self.score[outcome].merge(other.score[outcome])
+        self.position.merge(other.position)
+        for name, col in THRESHOLD_COLUMNS:
+            for key, acc in self.thresholds[name].items():
+                acc.merge(other.thresholds[name][key])
+        return self
@@ -0,0 +1,265 @@
+import math
+
+# Decision codes of compiled threshold policies. Codes above TAKE need one
+# more look at the table, which the lookup array cannot see.
+PASS = 0
+TAKE = 1
+TAKE_UNLESS_MILKING = 2   # take, unless Table.milking_potential()
+TAKE_IF_BELOW_FREE = 3    # take if nobody else holds card_up - 1, else
+                          # as VINDICTIVE
+VINDICTIVE = 4            # take if Table.vindictive_potential(), else pass
+
+
+class Strategy(object):
+    """Interface of a player's policy.
+
+    Every Player owns a Strategy, and Table asks the current player's
+    strategy for a decision whenever that player holds at least one token.
+    Subclasses implement decide(), and may implement explain() to report
+    which of their rules made each decision.
+
+    Methods:
+      decide()
+      explain()
+    """
+
+    def decide(self, table, player):
+        """
+        Args:
+          table (Table): the game, with player.eff_val set to the effective
+                  value of table.card_up to the player
+          player (Player): the player to move
+
+        Returns:
+          bool: True to take table.card_up, False to pass
+        """
+        raise NotImplementedError
+
+    def explain(self, table, player):
+        """
+        Like decide(), for instrumented tables (see events.py).
+
+        Returns:
+          tuple: (decision, name of the rule that made it)
+        """
+        return self.decide(table, player), type(self).__name__
+
+
+class ThresholdStrategy(Strategy):
+    """The threshold policy, driven by the player's attributes
+    (init_threshold, eff_val_threshold, token_threshold, pot_threshold).
+    """
+
+    def decide(self, table, player):
+        return self.explain(table, player)[0]
+
+    def explain(self, table, player):
+        if player.tokens < player.token_threshold \
+                  and table.pot > player.pot_threshold \
+                  and len(table.deck) > 9 \
+                  and table.card_up != table.deck.max_card:
+            return True, 'for_pot'
+        if len(player.cards) == 0:
+            # No cards in hand yet.
+            if player.eff_val <= player.init_threshold:
+                return True, 'first_card'
+            return False, 'first_card_pass'
+        if player.eff_val < 1.0:
+            # Note: < 1 instead of < 0 because it costs 1 point to pass
+            # (by playing a token)
+            if table.milking_potential():
+                return False, 'milk'
+            return True, 'low_value'
+        if len(table.deck) > 0 \
+            and player.eff_val <= player.eff_val_threshold \
+            and table.owner[table.card_up - 1] in (None, table.whose_turn):
+            # The player may choose to take a card with a positive
+            # effective value (i.e. one which increases the player's score)
+            # in order to obtain the pot and the card for constructing
+            # potential future runs.
+            # Note: Saving tokens for future use doesn't matter in the final
+            # round -- only the effective value matters at the end of the
+            # game.
+            return True, 'below_threshold'
+        if table.vindictive_potential():
+            return True, 'spite'
+        return False, 'pass'
+
+
+def half_steps(eff_val):
+    """
+    Effective value on a half-step grid: integer k maps to 2k and the open
+    interval (k, k + 1) to 2k + 1. Comparing it with twice an integer
+    threshold, by < or <=, gives the same answer as comparing eff_val.
+    """
+    floor = math.floor(eff_val)
+    return 2 * floor + (eff_val != floor)
+
+
+def threshold_codes(has_cards, top, eff_val, tokens, pot, left, \
+                    init_threshold, eff_val_threshold, token_threshold, \
+                    pot_threshold):
+    """
+    The decision code of ThresholdStrategy for discretized states. Works
+    elementwise on NumPy arrays as well as on ints.
+
+    Args:
+      has_cards: 1 if the player holds any card
+      top: 1 if card_up is the highest card of the deck
+      eff_val: effective value on the half-step grid of half_steps()
+      tokens, pot: tokens of the player and in the pot
+      left: cards left in the deck
+      init_threshold ... pot_threshold: the player's thresholds
+    """
+    import numpy as np
+    for_pot = (tokens < token_threshold) & (pot > pot_threshold) \
+              & (left > 9) & (top == 0)
+    first = np.where(eff_val <= 2 * init_threshold, TAKE, PASS)
+    later = np.where(eff_val < 2, TAKE_UNLESS_MILKING, \
+                     np.where((left > 0) \
+                              & (eff_val <= 2 * eff_val_threshold), \
+                              TAKE_IF_BELOW_FREE, VINDICTIVE))
+    return np.where(for_pot, TAKE, np.where(has_cards == 0, first, later))
+
+
+class CompiledThresholds(object):
+    """ThresholdStrategy precompiled into a dense lookup array.
+
+    The decision code for every discretized state is computed once, in a
+    uint8 array indexed by [has_cards, top, eff_val, tokens, pot, left].
+    Each axis is clipped where the thresholds stop telling values apart
+    (e.g. all pots above pot_threshold behave alike), which keeps the
+    array small.
+
+    Attributes:
+      thresholds (tuple): (init, eff_val, token, pot) thresholds
+      codes (ndarray[uint8]): decision codes, shape (2, 2, num_eff_vals,
+              num_tokens, num_pots, num_left)
+      eff_min, eff_max, max_tokens, max_pot, max_left (int): clipping
+              bounds of the axes (the lower bounds of the others are 0);
+              eff_val is on the grid of half_steps()
+
+    Methods:
+      index()
+      lookup()
+    """
+
+    def __init__(self, init_threshold=9, eff_val_threshold=0, \
+                 token_threshold=0, pot_threshold=8):
+        import numpy as np
+        self.thresholds = (init_threshold, eff_val_threshold, \
+                           token_threshold, pot_threshold)
+        # Bounds of the half-step grid beyond which nothing changes.
+        self.eff_min = 2 * min(0, init_threshold, eff_val_threshold)
+        self.eff_max = 2 * max(1, init_threshold, eff_val_threshold) + 1
+        self.max_tokens = max(0, token_threshold)
+        self.max_pot = max(0, pot_threshold + 1)
+        self.max_left = 10
+        has_cards, top, eff_val, tokens, pot, left = np.ix_(
+            np.arange(2), np.arange(2), \
+            np.arange(self.eff_min, self.eff_max + 1), \
+            np.arange(self.max_tokens + 1), np.arange(self.max_pot + 1), \
+            np.arange(self.max_left + 1))
+        self.codes = threshold_codes(has_cards, top, eff_val, tokens, pot, \
+                                     left, *self.thresholds)\
+                     .astype(np.uint8)
+        shape = self.codes.shape
+        # Row-major strides, for index().
+        self.strides = [int(np.prod(shape[axis + 1:])) \
+                        for axis in range(len(shape))]
+        # bytes indexes to plain ints, faster than an ndarray from Python.
+        self.flat = self.codes.tobytes()
+
+    def index(self, has_cards, top, eff_val, tokens, pot, left):
+        """Flat index into codes of one state (eff_val from half_steps())."""
+        s_has, s_top, s_eff, s_tokens, s_pot, s_left = self.strides
+        eff_val = self.eff_min if eff_val < self.eff_min \
+                  else self.eff_max if eff_val > self.eff_max else eff_val
+        return has_cards * s_has + top * s_top \
+               + (eff_val - self.eff_min) * s_eff \
+               + min(tokens, self.max_tokens) * s_tokens \
+               + min(pot, self.max_pot) * s_pot + min(left, self.max_left)
+
+    def lookup(self, has_cards, top, eff_val, tokens, pot, left):
+        """
+        Decision codes of many states at once, for array-based engines
+        such as BatchTable. Arguments are NumPy arrays, with plain effective
+        values.
+        """
+        import numpy as np
+        floor = np.floor(eff_val)
+        eff_val = np.clip(2 * floor + (eff_val != floor), self.eff_min, \
+                          self.eff_max).astype(np.intp)
+        return self.codes[has_cards, top, eff_val - self.eff_min, \
+                          np.minimum(tokens, self.max_tokens), \
+                          np.minimum(pot, self.max_pot), \
+                          np.minimum(left, self.max_left)]
+
+
+class CompiledStrategy(Strategy):
+    """ThresholdStrategy played from a CompiledThresholds lookup array.
+
+    Makes the same decisions as ThresholdStrategy. Compiled arrays are
+    shared between all strategies with the same thresholds.
+    """
+
+    compiled = {}
+
+    def __init__(self, init_threshold=9, eff_val_threshold=0, \
+                 token_threshold=0, pot_threshold=8):
+        key = (init_threshold, eff_val_threshold, token_threshold, \
+               pot_threshold)
+        if key not in CompiledStrategy.compiled:
+            CompiledStrategy.compiled[key] = CompiledThresholds(*key)
+        self.table = compiled = CompiledStrategy.compiled[key]
+        # Copied out of the CompiledThresholds, for decide().
+        self.flat = compiled.flat
+        self.s_has, self.s_top, self.s_eff, self.s_tokens, self.s_pot, \
+            self.s_left = compiled.strides
+        self.eff_min = compiled.eff_min
+        self.eff_max = compiled.eff_max
+        self.max_tokens = compiled.max_tokens
+        self.max_pot = compiled.max_pot
+
+    @classmethod
+    def for_player(cls, player):
+        """A CompiledStrategy with the thresholds of player."""
+        return cls(player.init_threshold, player.eff_val_threshold, \
+                   player.token_threshold, player.pot_threshold)
+
+    def decide(self, table, player):
+        # CompiledThresholds.index(), inlined.
+        eff_val = player.eff_val
+        floor = math.floor(eff_val)
+        eff_val = floor + floor + (eff_val != floor)
+        if eff_val < self.eff_min:
+            eff_val = self.eff_min
+        elif eff_val > self.eff_max:
+            eff_val = self.eff_max
+        tokens = player.tokens
+        if tokens > self.max_tokens:
+            tokens = self.max_tokens
+        pot = table.pot
+        if pot > self.max_pot:
+            pot = self.max_pot
+        deck = table.deck
+        left = len(deck.order) - deck.top
+        if left > 10:
+            left = 10
+        index = (eff_val - self.eff_min) * self.s_eff \
+                + tokens * self.s_tokens + pot * self.s_pot + left
+        if player.hand:
+            index += self.s_has
+        if table.card_up == deck.max_card:
+            index += self.s_top
+        code = self.flat[index]
+        if code == TAKE:
+            return True
+        if code == PASS:
+            return False
+        if code == TAKE_UNLESS_MILKING:
+            return not table.milking_potential()
+        if code == TAKE_IF_BELOW_FREE \
+           and table.owner[table.card_up - 1] in (None, table.whose_turn):
+            return True
+        return bool(table.vindictive_potential())
@@ -1,14 +1,19 @@
-import sys
-from random import randint
+import random
 from player import Player
 from deck import Deck
+from events import instrument, TextPrinter
 
 class Table(object):
-    """The Table object contains a Deck object, 3-5 Player objects, 
-       and the core game logic"""
+    """The Table object contains a Deck object, any number of Player
+       objects, and the core game logic.
+
+       Every decision costs the same however many players and cards there
+       are: hands are looked up through the owner index, and only the
+       players holding a neighbour of card_up have an effective value that
+       differs from the card's face value."""
 
     def __init__(self, players=None, num_ai_players=3, num_cards=33, offset=3, \
-                 dis=9, verbose=1):
+                 dis=9, verbose=1, rng=None, deck=None, subscribers=None):
         """
         Args:
           players = list of user-created objects of class Player
@@ -20,64 +25,180 @@ class Table(object):
                    0  friendly to computer parsing but not human reading
                    1  default human readable
                    2  detailed human readable
+                The game itself is printed by an events.TextPrinter, from
+                its first move: setting a table up prints nothing.
+          rng = random.Random instance used for the deck and for randomized
+                players and decisions (default: the global random module).
+                Pass a seeded instance to make a game reproducible.
+          deck = a Deck to play with, e.g. from DeckPool.deck(). If given,
+                 num_cards, offset and dis are ignored.
+          subscribers = callables to send game events to (see events.py).
+                 Without any (and with verbose=0) the table runs no event
+                 code at all.
+
+        Raises:
+          ValueError: if there are no players, or the given players'
+                  positions are out of bounds or taken twice, before
+                  anything is set up (see check_players())
         """
-        self.players = []
+        self.rng = random if rng is None else rng
+        players = list(players) if players else []
+        self.check_players(players, len(players) + num_ai_players)
         self.verbosity = verbose
+        self.num_ai_players = num_ai_players
+        self.num_players = len(players) + num_ai_players
+        # User-created players, and the randomized ones, which reset()
+        # gives new thresholds.
+        self.user_players = players
+        self.ai_players = []
+        if deck is None:
+            deck = Deck(num_cards, offset, dis, self.rng)
+        self.deck = deck
+        self.owner = []
+        self.seat_players()
+        self.subscribers = list(subscribers) if subscribers else []
+        if self.verbosity > 0:
+            self.subscribers.append(TextPrinter(self.verbosity))
+        if self.subscribers:
+            instrument(self)
+
+    @staticmethod
+    def check_players(players, num_players):
+        """
+        Check the user-created players of a table of num_players.
+
+        Raises:
+          ValueError: if there are no players, or a position is out of
+                  bounds or taken twice
+        """
+        if num_players < 1:
+            raise ValueError("No players!")
+        given_pos = set()
+        for player in players:
+            if player.pos >= num_players or player.pos < 0:
+                raise ValueError("Player position out of bounds")
+            if player.pos in given_pos:
+                raise ValueError("Duplicate player positions")
+            given_pos.add(player.pos)
+
+    def seat_players(self):
+        """
+        Seat the user-created players and fill the other positions with
+        randomized AI players, reusing those of the last game if there were
+        any, then turn up the first card.
+        """
         self.whose_turn = 0
         self.pot = 0
-        self.deck = Deck(num_cards, offset, dis)
-        try:
-            num_nonrandom_players = len(players)
-        except TypeError:
-            num_nonrandom_players = 0
-        self.num_players = num_nonrandom_players + num_ai_players
-        if self.num_players > 5:
-            sys.exit("Too many players! Max = 5")
-        else:
-            given_pos = []
-            if num_nonrandom_players > 0:
-                self.players = players
-                for player in players:
-                    given_pos.append(player.pos)
-                # check given player positions for sanity
-                if max(given_pos) >= self.num_players or min(given_pos) < 0:
-                    sys.exit("Player position out of bounds")
-                for i in range(4):
-                    cnt = given_pos.count(i)
-                    if cnt > 1:
-                        sys.exit("Duplicate player positions")
-                    if cnt > 0 and i >= self.num_players:
-                        sys.exit("Player position out of bounds")
-            for pos in range(self.num_players):
-                if pos not in given_pos:
-                    # add randomized AI player at this position
+        self.game_over = False
+        self.players = list(self.user_players)
+        given_pos = set(player.pos for player in self.players)
+        # Lowest position first, so each AI player keeps its seat.
+        spare = self.ai_players[::-1]
+        self.ai_players = []
+        for pos in range(self.num_players):
+            if pos not in given_pos:
+                # add randomized AI player at this position
+                if spare:
+                    player = spare.pop()
+                    player.pos = pos
+                    player.set_thresholds(*self.random_thresholds())
+                    self.players.append(player)
+                    self.ai_players.append(player)
+                else:
                     self.add_player(pos)
-            self.players.sort(key=lambda x: x.pos)
-        if self.verbosity > 0:
-            print("\nInitial deck:", self.deck.cards)
+        self.players.sort(key=lambda x: x.pos)
+        # Holder of each card, by position (None if not held).
+        # (reset() has already cleared the cards of the last game.)
+        if len(self.owner) != self.deck.max_card + 3:
+            self.owner = [None] * (self.deck.max_card + 3)
+        # Number of players without any cards, for milking_potential().
+        self.empty_hands = 0
+        for i, player in enumerate(self.players):
+            for card in player.cards:
+                self.owner[card] = i
+            if not player.cards:
+                self.empty_hands += 1
         self.card_up = self.deck.draw()
-        if self.verbosity > 0:
-            print("Card up:", self.card_up)
+        self.cache_effective_values()
 
-    def add_player(self, pos):
+    def reset(self, deck=None, players=None, rng=None):
         """
-        Add a player with random attributes
-        (card_thresohld, token_threshold, and eff_val_threshold)
+        Set the table up for a new game, reusing its objects: the Deck is
+        reshuffled in place, the user-created Players are reset (see
+        Player.reset()) and the randomized AI players get new thresholds.
+        Nothing is printed until the game is played, as for a new Table.
+
+        With the same rng state, the new game is the one a new Table with
+        the same arguments would deal.
+
+        Args:
+          deck = a Deck to play with instead of this table's, e.g. from
+                 DeckPool.deck()
+          players = user-created Players replacing those of the last game
+                 (the number of AI players stays the same)
+          rng = new random.Random instance, e.g. tournament.game_rng()
+                (default: keep the current one)
+
+        Returns:
+          Table: self
+
+        Raises:
+          ValueError: if players do not fit the table (see
+                  check_players())
+        """
+        if players is not None:
+            players = list(players)
+            self.check_players(players, len(players) + self.num_ai_players)
+        owner = self.owner
+        for player in self.players:
+            for card in player.cards:
+                owner[card] = None
+        if players is not None:
+            self.user_players = players
+            self.num_players = len(players) + self.num_ai_players
+        if rng is not None:
+            self.rng = rng
+        if deck is None:
+            self.deck.reset(self.rng)
+        else:
+            self.deck = deck
+        for player in self.user_players:
+            player.reset()
+        for player in self.ai_players:
+            player.reset()
+        self.seat_players()
+        if self.subscribers:
+            instrument(self)
+        return self
+
+    def start(self):
         """
+        Announce the game to the subscribers of an instrumented table (see
+        events.py), which its first move otherwise does. Does nothing on
+        an uninstrumented table.
+        """
+        pass
+
+    def random_thresholds(self):
+        """
+        Random (init, eff_val, token, pot) thresholds for an AI player.
+        """
+        randint = self.rng.randint
         init_threshold = randint(self.deck.min_card, self.deck.max_card - 1)
         eff_val_threshold = randint(0, 8)
         token_threshold = randint(0, 8)
         pot_threshold = randint(6, 20)
-        self.players.append( \
-             Player(pos, init_threshold, eff_val_threshold, token_threshold, \
-                    pot_threshold)
-        )
-        if self.verbosity > 0:
-            print("Created Player", pos+1, "at position", pos, \
-                  "with init_threshold:", self.players[pos].init_threshold, \
-                  "and token_threshold:", self.players[pos].token_threshold, \
-                  "and eff_val_threshold:", self.players[pos].eff_val_threshold, \
-                  "and pot_threshold:", self.players[pos].pot_threshold)
+        return init_threshold, eff_val_threshold, token_threshold, \
+            pot_threshold
+
+    def add_player(self, pos):
+        """
+        Add a player with random attributes
+        (card_thresohld, token_threshold, and eff_val_threshold)
+        """
+        player = Player(pos, *self.random_thresholds())
+        self.players.append(player)
+        self.ai_players.append(player)
 
     def other_player_cards(self):
         """
@@ -91,47 +212,80 @@ class Table(object):
                 other_player_cards += other_player.cards
         return other_player_cards
 
-    def get_effective_value(self):
+    def cache_effective_values(self):
         """
-        Returns the effective value of card_up to the current player.
-        The effective value is the amount by which taking the card 
-        and the pot woudl alter the player's current score.
+        Work out the effective value of card_up to every player, before the
+        pot is taken into account. The effective value is the amount by which
+        taking the card and the pot would alter the player's current score.
+
+        Called whenever a new card is turned up. While the card is passed
+        around, only the pot changes, and it is subtracted on lookup (see
+        effective_value()).
+
+        Only the holders of card_up - 1, card_up + 1 and card_up + 2 can
+        value card_up at anything but its face value, so only their values
+        are stored: a new card costs the same for any number of players.
         """
-        for player in self.players:
-            if self.card_up + 1 in player.cards:
-                if self.card_up - 1 in player.cards:
-                    # Bridging card - connects two cards/runs in the player's
-                    # hand. Would lower player's score by the value of the
-                    # higher run.
-                    effective_value = -(self.card_up + 1)
-                else:
-                    # If taken, card_up would become the lowest card in a run.
-                    # Would lower player's score by 1 point.
-                    effective_value = -1
-            elif self.card_up - 1 in player.cards:
-                # If taken, card_up would go at the end of a run.
-                # Doesn't change player's score.
-                effective_value = 0
-            elif self.card_up + 2 in player.cards:
-                # card_up is 1 card away from being connected in a run.
-                if self.card_up + 1 in self.other_player_cards():
-                    # The bridging card has already been taken:
-                    # no chance of completing the run.
-                    effective_value = self.card_up
-                else:
-                    # Effective value depends on probability of completing the
-                    # run.
-                    prob = float(len(self.deck.cards)) / float(self.deck.tot_orig_cards)
-                    # Calculate expectation value.
-                    effective_value = -2.0*prob + self.card_up*(1.0 - prob)
-                    if self.verbosity == 2:
-                        print("  Player {0}: effective value = {1:.2f}"\
-                               .format(player.pos + 1, effective_value - self.pot))
+        card_up = self.card_up
+        owner = self.owner
+        below = owner[card_up - 1]
+        # Owner of the card that would bridge card_up to a run starting two
+        # cards above it.
+        bridge_owner = above = owner[card_up + 1]
+        above2 = owner[card_up + 2]
+        self.values = values = {}
+        self.bridge_values = {}
+        if above is not None:
+            if above == below:
+                # Bridging card - connects two cards/runs in the player's
+                # hand. Would lower player's score by the value of the
+                # higher run.
+                values[above] = -(card_up + 1)
+            else:
+                # If taken, card_up would become the lowest card in a run.
+                # Would lower player's score by 1 point.
+                values[above] = -1
+        if below is not None and below != above:
+            # If taken, card_up would go at the end of a run.
+            # Doesn't change player's score.
+            values[below] = 0
+        if above2 is not None and above2 != above and above2 != below:
+            # card_up is 1 card away from being connected in a run.
+            # Effective value depends on probability of completing the
+            # run.
+            prob = float(len(self.deck)) / float(self.deck.tot_orig_cards)
+            # Calculate expectation value.
+            expectation = -2.0*prob + card_up*(1.0 - prob)
+            if bridge_owner is None:
+                values[above2] = expectation
             else:
-                effective_value = self.card_up
-            # Card value is offset by the number of tokens in the pot.
-            effective_value -= self.pot
-            player.eff_val = effective_value
+                # The bridging card has already been taken:
+                # no chance of completing the run. The check only looks
+                # at the cards of players other than the one whose turn
+                # it is, so on the bridge owner's own turn the
+                # expectation value still applies.
+                self.bridge_values[above2] = expectation
+        self.bridge_owner = bridge_owner
+
+    def effective_value(self, i):
+        """
+        Returns the effective value of card_up to the player at position i,
+        from the values cached by cache_effective_values().
+        """
+        if self.whose_turn == self.bridge_owner and i in self.bridge_values:
+            effective_value = self.bridge_values[i]
+        else:
+            effective_value = self.values.get(i, self.card_up)
+        # Card value is offset by the number of tokens in the pot.
+        return effective_value - self.pot
+
+    def get_effective_value(self):
+        """
+        Sets the eff_val attribute of every player to the effective value
+        of card_up to that player (see effective_value()).
+        """
+        for i, player in enumerate(self.players):
+            player.eff_val = self.effective_value(i)
 
     def milking_potential(self):
         """
@@ -141,10 +295,8 @@ class Table(object):
         """
         player = self.players[self.whose_turn]
         # Don't milk if any player has no cards in hand
-        for other_player in self.players:
-            if other_player != player:
-                if len(other_player.cards) == 0:
-                    return 0
+        if self.empty_hands > (len(player.cards) == 0):
+            return 0
         if self.pot > player.pot_threshold:
             return 0
         if self.card_up == self.deck.max_card:
@@ -153,22 +305,20 @@ class Table(object):
             # max_card-2...max_card-n). Always better to force someone else to
             # take the highest card in the game, until tokens become a
             # consideration.
-            if len(self.deck.cards) == 0 or self.pot < player.pot_threshold:
+            if len(self.deck) == 0 or self.pot < player.pot_threshold:
                 return 1
         # Ensure the effective value is high enough that the card will come
         # back to the milking player, i.e. its effective value will not
         # drop to/below 4 before all other players have passed.
-        i = (self.whose_turn + 1) % 3
+        i = (self.whose_turn + 1) % self.num_players
         j = 1
         while i != self.whose_turn:
             other_player = self.players[i]
-            if other_player.tokens == 0 or other_player.eff_val < j + 7:
-                if self.verbosity == 2:
-                    print("  Player {}: too risky, not milking"\
-                          .format(player.pos + 1))
+            if other_player.tokens == 0 or self.effective_value(i) < j + 7:
+                # Too risky.
                 return 0
             j += 1
-            i = (i + 1) % 3
+            i = (i + 1) % self.num_players
 #       for other_player in self.players:
 #           if other_player != player:
 #               if other_player.tokens < self.num_players \
@@ -176,8 +326,6 @@ class Table(object):
 #                   if self.verbosity == 2:
 #                       print("  too risky, not milking")
 #                   return 0
-        if self.verbosity == 2:
-            print("  Player {}: milking".format(player.pos + 1))
         return 1
 
     def vindictive_potential(self):
@@ -188,85 +336,72 @@ class Table(object):
         and 0 if vindictiveness is not warranted.
         """
         player = self.players[self.whose_turn]
-        score = player.get_score()
-        thresh = randint(20, 40)
-        val = 0
-        if len(self.deck.cards) > self.num_players:
+        thresh = self.rng.randint(20, 40)
+        if len(self.deck) > self.num_players:
             # Don't be vindictive until late in the game.
             return 0
-        for other_player in self.players:
+        score = player.get_score()
+        val = 0
+        for i, other_player in enumerate(self.players):
             if other_player != player:
                 if other_player.get_score() + thresh > score:
                     # Player is not losing, or is not trailing by enough points,
                     # to risk taking the card.
                     return 0
-                if other_player.eff_val < val:
-                    val = other_player.eff_val
+                eff_val = self.effective_value(i)
+                if eff_val < val:
+                    val = eff_val
         if val < 0:
-            if self.verbosity == 2:
-                print("  player takes card out of spite")
             return 1
 
     def play(self):
         """
-        Core game logic. Decide whether a player will take or pass on the card
-        card_up, based on the player's attributes (init_threshold,
-        token_threshold, eff_val_threshold) and circumstances of the game
-        (value of card_up, number of cards remaining in deck, cards in other
-        players' possession, etc.)
+        Play the game to completion. Equivalent to run(); kept so existing
+        callers (nothx.py, analysis.ipynb) keep working.
         """
+        return self.run()
+
+    def run(self):
+        """
+        Make decisions one at a time with step() until the last card has been
+        taken. The loop runs at constant stack depth regardless of how many
+        times the token is passed around the table.
+        """
+        while self.step():
+            pass
+        return 0
+
+    def step(self):
+        """
+        Core game logic. The current player takes or passes card_up, as
+        decide() says.
+
+        Exactly one take/pass decision is made per call.
+
+        Returns:
+            bool: True if the game continues, False once it is over
+        """
+        if self.game_over:
+            return False
         player = self.players[self.whose_turn]
-        self.get_effective_value()
-        if player.tokens == 0:
-            if self.verbosity == 2:
-                print("  Player {}: No tokens left".format(player.pos + 1))
-            self.player_takes_card()
-        elif player.tokens < player.token_threshold \
-                  and self.pot > player.pot_threshold \
-                  and len(self.deck.cards) > 9 \
-                  and self.card_up != self.deck.max_card:
-            if self.verbosity == 2:
-                print("  Player {} takes it for the pot. (tokens = {}, pot = {})"\
-                      .format(player.pos + 1, player.tokens, self.pot))
+        player.eff_val = self.effective_value(self.whose_turn)
+        if self.decide(player):
             self.player_takes_card()
-        elif len(player.cards) == 0:
-            # No cards in hand yet.
-            if player.eff_val <= player.init_threshold:
-                if self.verbosity == 2:
-                    print("  Player {}: Card within initial threshold value"\
-                          .format(player.pos + 1))
-                self.player_takes_card()
-            else:
-                self.player_passes()
         else:
-            if player.eff_val < 1.0:
-                # Note: < 1 instead of < 0 because it costs 1 point to pass
-                # (by playing a token)
-                if self.verbosity == 2:
-                    print("  Player {}: effective value < 1"\
-                          .format(player.pos + 1))
-                if self.milking_potential():
-                    self.player_passes()
-                else:
-                    self.player_takes_card()
-            elif len(self.deck.cards) > 0 \
-                and player.eff_val <= player.eff_val_threshold \
-                and self.card_up - 1 not in self.other_player_cards():
-                # The player may choose to take a card with a positive
-                # effective value (i.e. one which increases the player's score)
-                # in order to obtain the pot and the card for constructing
-                # potential future runs.
-                # Note: Saving tokens for future use doesn't matter in the final
-                # round -- only the effective value matters at the end of the 
-                # game.
-                if self.verbosity == 2:
-                    print("  Player {}: effective value below threshold"\
-                          .format(player.pos + 1))
-                self.player_takes_card()
-            elif self.vindictive_potential():
-                self.player_takes_card()
-            else:
-                self.player_passes()
+            self.player_passes()
+        return not self.game_over
+
+    def decide(self, player):
+        """
+        Whether the player to move takes card_up: always when out of
+        tokens, otherwise as the player's explain() says (see strategy.py).
+        An instrumented table reports each decision from here (see
+        events.py).
+
+        Returns:
+            bool: True to take, False to pass
+        """
+        return player.tokens == 0 or player.explain(self)[0]
 
     def player_passes(self):
         """
@@ -275,12 +410,8 @@ class Table(object):
         """
         player = self.players[self.whose_turn]
         player.play_token()
-        if self.verbosity > 0:
-            print("Player", player.pos + 1, sorted(player.cards),\
-                  "plays token, has", player.tokens, "remaining")
         self.pot += 1
         self.whose_turn = (self.whose_turn + 1) % self.num_players
-        self.play()
 
     def player_takes_card(self):
         """
@@ -289,20 +420,17 @@ class Table(object):
         and the same player may either take it or play a token and pass.
         """
         player = self.players[self.whose_turn]
-        if self.verbosity > 0:
-            print("Player", player.pos + 1, sorted(player.cards), \
-                  "takes card:", self.card_up)
+        if not player.cards:
+            self.empty_hands -= 1
         player.take_card(self.card_up, self.pot)
+        self.owner[self.card_up] = self.whose_turn
         self.pot = 0
         self.card_up = self.deck.draw()
         if (self.card_up):
-            if self.verbosity > 0:
-                print("Card up:", self.card_up)
-            self.play()
+            self.cache_effective_values()
         else:
-            if self.verbosity > 0:
-                print("Game Over\n")
-            return 0
+            self.game_over = True
+        return 0
 
     def score(self):
         """
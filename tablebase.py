@@ -0,0 +1,304 @@
+import mmap
+import random
+import struct
+import hashlib
+from player import Player
+from table import Table
+from strategy import Strategy, ThresholdStrategy
+
+# File layout: a header, then num_slots slots of an open-addressing hash
+# table (linear probing). A slot holds the 64-bit hash of a position (0 for
+# an empty slot) and the value of taking rather than passing for the player
+# to move: E[score change | take] - E[score change | pass].
+MAGIC = b'NOTHXTB1'
+HEADER = struct.Struct('<8sIIIIIQ')
+SLOT = struct.Struct('<Qf4x')
+
+
+def card_delta(hand, card):
+    """
+    Change in the sum of run heads (the score before tokens) when card is
+    added to the bitmask hand.
+    """
+    above = (hand >> (card + 1)) & 1
+    below = (hand >> (card - 1)) & 1
+    if above:
+        return -(card + 1) if below else -1
+    return 0 if below else card
+
+
+def relevant(hand, unseen, card_up, remaining):
+    """
+    Compress a hand to its run-relevant bits: the cards next to a card
+    that can still be dealt. No other card can change the score again.
+    """
+    live = (unseen if remaining else 0) | (1 << card_up)
+    return hand & ((live << 1) | (live >> 1))
+
+
+class EndgameSolver(object):
+    """Exact expectimax for the last few cards of a game.
+
+    Every player takes or passes so as to minimize their own expected
+    final score (max-n). The next card is drawn uniformly from the unseen
+    cards, i.e. those neither held nor face up, since the discards are
+    unknown. Positions are memoized on their run-relevant bits, and every
+    memoized decision can be read back with solved().
+
+    Methods:
+      solve()
+      solved()
+    """
+
+    def __init__(self, num_players):
+        self.num_players = num_players
+        # position -> (values, take value)
+        self.memo = {}
+
+    def solve(self, card, pot, turn, tokens, hands, unseen, remaining):
+        """
+        Returns:
+          tuple: expected change of every player's score from here to the
+                 end of the game, under optimal play
+        """
+        if remaining == 0:
+            unseen = 0
+        hands = tuple(relevant(h, unseen, card, remaining) for h in hands)
+        key = (card, pot, turn, tokens, hands, unseen, remaining)
+        solution = self.memo.get(key)
+        if solution is None:
+            take, pass_ = self.options(card, pot, turn, tokens, hands, \
+                                       unseen, remaining)
+            if pass_ is None:
+                solution = (take, None)
+            elif take[turn] <= pass_[turn]:
+                solution = (take, take[turn] - pass_[turn])
+            else:
+                solution = (pass_, take[turn] - pass_[turn])
+            self.memo[key] = solution
+        return solution[0]
+
+    def solved(self):
+        """
+        Yield (position, take value) for every memoized position where the
+        player to move could pass. The take value is the expected score
+        change of that player on taking, minus that on passing.
+        """
+        for position, (values, take_value) in self.memo.items():
+            if take_value is None:
+                continue
+            card, pot, turn, tokens, hands, unseen, remaining = position
+            yield (card, pot, 0, tokens[turn:] + tokens[:turn], \
+                   hands[turn:] + hands[:turn], unseen, remaining), take_value
+
+    def options(self, card, pot, turn, tokens, hands, unseen, remaining):
+        """Values of taking and of passing (None if out of tokens)."""
+        P = self.num_players
+        # Take the card and the pot; the same player faces the next card.
+        delta = card_delta(hands[turn], card) - pot
+        new_hands = hands[:turn] + (hands[turn] | (1 << card),) \
+                    + hands[turn + 1:]
+        new_tokens = tokens[:turn] + (tokens[turn] + pot,) + tokens[turn + 1:]
+        take = [0.0] * P
+        if remaining > 0:
+            draws = 0
+            rest = unseen
+            while rest:
+                low = rest & -rest
+                rest ^= low
+                values = self.solve(low.bit_length() - 1, 0, turn, \
+                                    new_tokens, new_hands, unseen ^ low, \
+                                    remaining - 1)
+                for i in range(P):
+                    take[i] += values[i]
+                draws += 1
+            take = [v / draws for v in take]
+        take[turn] += delta
+        if tokens[turn] == 0:
+            return tuple(take), None
+        # Pass: play a token (costing a point) into the pot.
+        new_tokens = tokens[:turn] + (tokens[turn] - 1,) + tokens[turn + 1:]
+        pass_ = list(self.solve(card, pot + 1, (turn + 1) % P, new_tokens, \
+                                hands, unseen, remaining))
+        pass_[turn] += 1
+        return tuple(take), tuple(pass_)
+
+
+def table_position(table):
+    """
+    The position facing the current player of a Table, as arguments for
+    EndgameSolver, with seats rotated so that the current player is 0.
+    """
+    P = table.num_players
+    turn = table.whose_turn
+    seats = [table.players[(turn + i) % P] for i in range(P)]
+    tokens = tuple(player.tokens for player in seats)
+    hands = tuple(player.hand for player in seats)
+    seen = 1 << table.card_up
+    for hand in hands:
+        seen |= hand
+    all_cards = ((1 << (table.deck.max_card + 1)) - 1) \
+                ^ ((1 << table.deck.min_card) - 1)
+    unseen = all_cards & ~seen
+    return (table.card_up, table.pot, 0, tokens, hands, unseen, len(table.deck))
+
+
+def position_key(card, pot, turn, tokens, hands, unseen, remaining, \
+                 token_cap):
+    """
+    Stable, nonzero 64-bit hash of a position, compressed to its
+    run-relevant bits and with token counts capped at token_cap.
+    """
+    if remaining == 0:
+        unseen = 0
+    hands = tuple(relevant(h, unseen, card, remaining) for h in hands)
+    tokens = tuple(min(t, token_cap) for t in tokens)
+    data = repr((card, pot, turn, tokens, hands, unseen, remaining)).encode()
+    key = int.from_bytes(hashlib.blake2b(data, digest_size=8).digest(), \
+                         'little')
+    return key or 1
+
+
+def write_tablebase(path, entries, num_players, num_cards=33, offset=3, \
+                    max_remaining=1, token_cap=8):
+    """
+    Write {position key: take value} entries as a tablebase file. The table
+    is sized to stay at most half full.
+    """
+    num_slots = max(1, 2 * len(entries))
+    slots = bytearray(num_slots * SLOT.size)
+    for key, value in entries.items():
+        i = key % num_slots
+        while SLOT.unpack_from(slots, i * SLOT.size)[0]:
+            i = (i + 1) % num_slots
+        SLOT.pack_into(slots, i * SLOT.size, key, value)
+    with open(path, 'wb') as f:
+        f.write(HEADER.pack(MAGIC, num_players, num_cards, offset, \
+                            max_remaining, token_cap, num_slots))
+        f.write(slots)
+
+
+class Tablebase(object):
+    """Read-only, memory-mapped endgame tablebase.
+
+    Nothing is loaded up front: lookups read the slots they probe straight
+    from the mapped file, and every process mapping the same file shares
+    its pages.
+
+    Methods:
+      lookup()
+    """
+
+    def __init__(self, path):
+        with open(path, 'rb') as f:
+            self.map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, self.num_players, self.num_cards, self.offset, \
+            self.max_remaining, self.token_cap, self.num_slots = \
+            HEADER.unpack_from(self.map, 0)
+        if magic != MAGIC:
+            raise ValueError("{} is not a tablebase file".format(path))
+
+    def lookup(self, key):
+        """Returns the take value stored for key, or None."""
+        i = key % self.num_slots
+        while True:
+            slot_key, value = SLOT.unpack_from(self.map, \
+                                               HEADER.size + i * SLOT.size)
+            if slot_key == key:
+                return value
+            if slot_key == 0:
+                return None
+            i = (i + 1) % self.num_slots
+
+    def take_value(self, table):
+        """Take value of the current player's position in table, or None."""
+        if len(table.deck) > self.max_remaining \
+           or table.num_players != self.num_players \
+           or table.deck.tot_orig_cards != self.num_cards \
+           or table.deck.min_card != self.offset:
+            return None
+        return self.lookup(position_key(*table_position(table), \
+                                        token_cap=self.token_cap))
+
+
+class TablebaseStrategy(Strategy):
+    """Plays the endgame from a tablebase.
+
+    Positions found in the tablebase are played optimally; everything else
+    is left to a fallback strategy.
+    """
+
+    def __init__(self, tablebase, fallback=None):
+        """
+        Args:
+          tablebase (Tablebase or str): tablebase, or the path of its file
+          fallback (Strategy): default ThresholdStrategy
+        """
+        if not isinstance(tablebase, Tablebase):
+            tablebase = Tablebase(tablebase)
+        self.tablebase = tablebase
+        self.fallback = ThresholdStrategy() if fallback is None else fallback
+
+    def decide(self, table, player):
+        return self.explain(table, player)[0]
+
+    def explain(self, table, player):
+        value = self.tablebase.take_value(table)
+        if value is None:
+            return self.fallback.explain(table, player)
+        return value <= 0, 'tablebase'
+
+
+class TablebasePlayer(Player):
+    """A threshold Player that plays the endgame from a tablebase (see
+    TablebaseStrategy).
+    """
+
+    def __init__(self, pos, tablebase, *args, **kwargs):
+        """
+        Args:
+          pos (int): Position in play order (starting from 0)
+          tablebase (Tablebase or str): tablebase, or the path of its file
+          args, kwargs: thresholds, as for Player
+        """
+        Player.__init__(self, pos, *args, **kwargs)
+        self.strategy = TablebaseStrategy(tablebase, self.strategy)
+        self.tablebase = self.strategy.tablebase
+
+
+def build(path, num_games, num_players=3, max_remaining=1, token_cap=8, \
+          seed=0, num_cards=33, offset=3, dis=9):
+    """
+    Build a tablebase from the endgame positions reached in num_games
+    simulated games. Each one is solved exactly, and every position met
+    along the way by the search (later passes, later draws) is stored too.
+
+    Positions are keyed with token counts capped at token_cap, so that a
+    stored decision serves every position differing only in how many
+    tokens beyond the cap the players hold. On the last card the decision
+    depends only on which players can still pass, so nothing is lost
+    there; with cards left to draw, a cap of 8 changes about 2% of
+    decisions.
+
+    Returns:
+      int: number of positions stored
+    """
+    entries = {}
+    solver = EndgameSolver(num_players)
+    mytable = Table(num_ai_players=num_players, num_cards=num_cards, \
+                    offset=offset, dis=dis, verbose=0, \
+                    rng=random.Random("{}:0".format(seed)))
+    for game in range(num_games):
+        if game:
+            mytable.reset(rng=random.Random("{}:{}".format(seed, game)))
+        while not mytable.game_over:
+            if len(mytable.deck) <= max_remaining:
+                solver.solve(*table_position(mytable))
+            mytable.step()
+        # The memo only helps within a game: the unseen cards differ.
+        for position, value in solver.solved():
+            entries[position_key(*position, token_cap=token_cap)] = value
+        solver.memo.clear()
+    write_tablebase(path, entries, num_players, num_cards, offset, \
+                    max_remaining, token_cap)
+    return len(entries)
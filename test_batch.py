@@ -0,0 +1,71 @@
+from fractions import Fraction
+import numpy as np
+from batch import BatchTable, THRESHOLDS, cross_check
+from deck import Deck
+from player import Player
+from table import Table
+
+
+class ExactTable(Table):
+    """Table with BatchTable's exact arithmetic for effective values."""
+
+    def cache_effective_values(self):
+        Table.cache_effective_values(self)
+        card_up = self.card_up
+        owner = self.owner
+        above2 = owner[card_up + 2]
+        if above2 is not None and above2 != owner[card_up + 1] \
+           and above2 != owner[card_up - 1]:
+            # The expectation of completing the run, as a fraction.
+            remaining = len(self.deck)
+            total = self.deck.tot_orig_cards
+            expectation = Fraction(card_up * (total - remaining) \
+                                   - 2 * remaining, total)
+            if above2 in self.values:
+                self.values[above2] = expectation
+            else:
+                self.bridge_values[above2] = expectation
+
+
+class FixedThreshold(object):
+    """Stands in for both engines' random vindictiveness threshold."""
+
+    def randint(self, low, high):
+        return 30
+
+    def integers(self, low, high, size):
+        return np.full(size, 30)
+
+
+def play_on_table(batch, game):
+    """Play game of batch on a Table, with the same deck and thresholds."""
+    dealt = [int(card) for card in batch.decks[game]]
+    discarded = [card for card in range(batch.min_card, batch.max_card + 1) \
+                 if card not in dealt]
+    deck = Deck(batch.tot_orig_cards, batch.min_card, len(discarded), \
+                order=discarded + dealt)
+    players = [Player(pos, *[int(getattr(batch, name)[game, pos]) \
+                             for name in THRESHOLDS]) \
+               for pos in range(batch.num_players)]
+    mytable = ExactTable(players=players, num_ai_players=0, verbose=0, \
+                         deck=deck, rng=FixedThreshold())
+    mytable.play()
+    return mytable.score()
+
+
+def test_batch_matches_table_game_for_game():
+    for num_players in (3, 4, 5):
+        batch = BatchTable(1000, num_players, rng=num_players)
+        batch.rng = FixedThreshold()
+        batch.run()
+        results = batch.score()
+        for game in range(batch.num_games):
+            for features in play_on_table(batch, game):
+                pos = features[2]
+                assert features[0] == results['win'][game, pos], game
+                assert features[1] == results['score'][game, pos], game
+
+
+def test_cross_check_statistics():
+    for pos, name, table_mean, batch_mean, z in cross_check(4000, seed=1):
+        assert abs(z) < 4.5, (pos, name, table_mean, batch_mean)
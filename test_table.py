@@ -0,0 +1,21 @@
+from player import Player
+from table import Table
+from tournament import game_rng
+
+
+def test_reset_deals_what_a_new_table_would():
+    for num_ai_players, table_args in ((3, {}), (5, {}), \
+                                       (2, {'num_cards': 60, 'dis': 12})):
+        users = [Player(0, 20, 3, 4, 10)] if num_ai_players == 2 else []
+        reused = Table(players=users, num_ai_players=num_ai_players, \
+                       verbose=0, rng=game_rng(7, 0), **table_args)
+        for game in range(300):
+            if game:
+                reused.reset(rng=game_rng(7, game))
+            reused.play()
+            fresh_users = [Player(0, 20, 3, 4, 10)] if users else []
+            fresh = Table(players=fresh_users, \
+                          num_ai_players=num_ai_players, verbose=0, \
+                          rng=game_rng(7, game), **table_args)
+            fresh.play()
+            assert reused.score() == fresh.score(), (num_ai_players, game)
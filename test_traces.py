@@ -0,0 +1,31 @@
+from player import Player
+from table import Table
+from tournament import game_rng
+from traces import TraceWriter, TraceReader
+
+
+def test_replay_matches_score_across_segment_widths(tmp_path):
+    path = str(tmp_path / 'games.trace')
+    games = []
+    with TraceWriter(path) as writer:
+        for game in range(40):
+            rng = game_rng(0, game)
+            if game % 10 == 3:
+                # A threshold beyond one byte: a wide record.
+                players = [Player(0, 10, 2, 3, 200)]
+                mytable = Table(players=players, num_ai_players=3, \
+                                verbose=0, rng=rng)
+            elif game % 10 == 7:
+                mytable = Table(num_ai_players=4, num_cards=300, dis=40, \
+                                verbose=0, rng=rng)
+            else:
+                mytable = Table(num_ai_players=3, verbose=0, rng=rng)
+            mytable.play()
+            writer.add(mytable)
+            games.append(mytable.score())
+    reader = TraceReader(path)
+    assert len(reader) == len(games)
+    assert {wide for setup in reader.setups for wide in setup[3:]} \
+        == {False, True}
+    for game, features in enumerate(games):
+        assert reader.replay(game).score() == features, game
@@ -0,0 +1,159 @@
+import os
+import random
+from multiprocessing import Pool
+from table import Table
+
+
+def game_rng(seed, game):
+    """
+    Return the random number generator for one game of a tournament.
+
+    Every game gets its own stream, derived from the tournament seed and
+    the game's index, so a game plays out the same way no matter which
+    worker process runs it.
+    """
+    return random.Random("{}:{}".format(seed, game))
+
+
+def play_games(task):
+    """
+    Play a contiguous block of tournament games.
+
+    Args:
+      task (tuple): (seed, first game, last game + 1, table keyword args)
+
+    Returns:
+      list: Table.score() features of each game, in game order
+    """
+    seed, start, stop, table_args = task
+    results = []
+    mytable = Table(verbose=0, rng=game_rng(seed, start), **table_args)
+    for game in range(start, stop):
+        if game > start:
+            # Same game as a new Table, without rebuilding one.
+            mytable.reset(rng=game_rng(seed, game))
+        mytable.play()
+        results.append(mytable.score())
+    return results
+
+
+def play_stats(task):
+    """
+    Play a block of tournament games (see play_games()) and return only
+    their StrategyStats, so no raw game data leaves the worker.
+    """
+    from stats import StrategyStats
+    stats = StrategyStats()
+    for game in play_games(task):
+        stats.add(game)
+    return stats
+
+
+def tasks_for(num_games, seed, workers, chunk, table_args):
+    """Split a tournament into (seed, start, stop, table_args) blocks."""
+    if chunk is None:
+        chunk = max(1, min(1000, num_games // (4 * workers)))
+    return [(seed, start, min(start + chunk, num_games), table_args) \
+            for start in range(0, num_games, chunk)]
+
+
+def iter_tournament(num_games, num_players=3, seed=0, workers=None, \
+                    chunk=None, **table_args):
+    """
+    Play num_games bot-only games, spread over a pool of worker processes,
+    and yield their results in game order as they arrive.
+
+    Args:
+      num_games (int): number of games to play
+      num_players (int): number of randomized players at every table
+      seed: tournament seed (any value accepted by random.seed). The same
+              seed gives identical results for any number of workers.
+      workers (int): number of worker processes (default: one per CPU).
+              With 1 worker, games are played in this process.
+      chunk (int): number of games handed to a worker at a time
+      table_args: further keyword arguments for Table (num_cards, offset,
+              dis)
+
+    Yields:
+      list: Table.score() features of each game
+    """
+    if workers is None:
+        workers = os.cpu_count() or 1
+    table_args['num_ai_players'] = num_players
+    tasks = tasks_for(num_games, seed, workers, chunk, table_args)
+    if workers == 1:
+        for task in tasks:
+            yield from play_games(task)
+    else:
+        with Pool(workers) as pool:
+            for block in pool.imap(play_games, tasks):
+                yield from block
+
+
+def run_tournament(num_games, num_players=3, seed=0, workers=None, \
+                   chunk=None, **table_args):
+    """
+    Play a tournament (see iter_tournament()) and return the results.
+
+    Returns:
+      list: Table.score() features of every game, in game order
+    """
+    return list(iter_tournament(num_games, num_players, seed, workers, \
+                                chunk, **table_args))
+
+
+def iter_stats(num_games, num_players=3, seed=0, workers=None, chunk=None, \
+               **table_args):
+    """
+    Play a tournament (see iter_tournament()) keeping only running
+    statistics. Each worker summarizes its own blocks of games; the
+    summaries are merged in game order.
+
+    Yields:
+      StrategyStats: the statistics of all games played so far, after each
+              block of games
+    """
+    from stats import StrategyStats
+    if workers is None:
+        workers = os.cpu_count() or 1
+    table_args['num_ai_players'] = num_players
+    tasks = tasks_for(num_games, seed, workers, chunk, table_args)
+    stats = StrategyStats()
+    if workers == 1:
+        for task in tasks:
+            yield stats.merge(play_stats(task))
+    else:
+        with Pool(workers) as pool:
+            for block in pool.imap(play_stats, tasks):
+                yield stats.merge(block)
+
+
+def summarize(results):
+    """
+    Summarize tournament results by player position, in a single pass.
+
+    Args:
+      results: iterable of Table.score() features
+
+    Returns:
+      list of (pos, games, wins, ties, mean score)
+    """
+    games = 0
+    wins = []
+    ties = []
+    tot = []
+    for game in results:
+        if not games:
+            wins = [0] * len(game)
+            ties = [0] * len(game)
+            tot = [0] * len(game)
+        games += 1
+        for player in game:
+            pos = player[2]
+            if player[0] == 1:
+                wins[pos] += 1
+            elif player[0] == 2:
+                ties[pos] += 1
+            tot[pos] += player[1]
+    return [(pos, games, wins[pos], ties[pos], tot[pos] / games) \
+            for pos in range(len(tot))]
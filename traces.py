@@ -0,0 +1,325 @@
+import mmap
+import bisect
+import struct
+from collections import namedtuple
+from deck import Deck
+from player import Player
+from table import Table
+
+# A trace file is a sequence of segments, each appended whole by
+# TraceWriter.flush(). A segment is a header, an index of num_games + 1
+# offsets into its data, and the data: one record per game.
+MAGIC = b'NOTHXTR2'
+# magic, num_games, data length, num_cards, offset, dis, wide
+SEGMENT = struct.Struct('<8sIIHHHBx')
+OFFSET = struct.Struct('<I')
+# A record starts with the number of players and of actions, followed by
+# the four thresholds of each player (in Player argument order), the cards
+# dealt (in draw order) and one bit per action, lowest bit first: 1 for a
+# take, 0 for a pass. Thresholds and cards take one byte each, or two in
+# the segments marked wide, for games with larger values.
+RECORD = struct.Struct('<BH')
+# (threshold format, card format) of narrow and wide segments.
+FIELDS = (('b', 'B'), ('h', 'H'))
+
+Trace = namedtuple('Trace', 'num_cards offset dis thresholds cards actions')
+
+
+def table_actions(table):
+    """
+    The take/pass actions of a game, in order, as a list of bools (True for
+    a take).
+
+    Recovered from the players' token histories, which gain one entry per
+    action: a pass loses a token, a take gains the pot (perhaps 0). The
+    player to move only changes after a pass, so the histories interleave
+    in one way only.
+    """
+    histories = [player.token_history for player in table.players]
+    next_action = [1] * len(histories)
+    num_actions = sum(len(history) - 1 for history in histories)
+    actions = []
+    turn = 0
+    for i in range(num_actions):
+        history = histories[turn]
+        j = next_action[turn]
+        take = history[j] >= history[j - 1]
+        next_action[turn] = j + 1
+        actions.append(take)
+        if not take:
+            turn = (turn + 1) % len(histories)
+    return actions
+
+
+def table_thresholds(table):
+    """The thresholds of every player, flat, in record order."""
+    thresholds = []
+    for player in table.players:
+        thresholds += [player.init_threshold, player.eff_val_threshold, \
+                       player.token_threshold, player.pot_threshold]
+    return thresholds
+
+
+def is_wide(table):
+    """
+    Whether the record of table needs two bytes per threshold and card.
+
+    Raises:
+      ValueError: if the game does not fit a record at all: more than 255
+              players, or a threshold or card too large for two bytes
+    """
+    if len(table.players) > 255:
+        raise ValueError("Traces store up to 255 players")
+    thresholds = table_thresholds(table)
+    low, high = min(thresholds), max(thresholds)
+    if low < -32768 or high > 32767 or table.deck.max_card > 65535:
+        raise ValueError("Traces store thresholds from -32768 to 32767 and "
+                         "cards up to 65535")
+    return low < -128 or high > 127 or table.deck.max_card > 255
+
+
+def encode(table, wide=False):
+    """Record of a finished game, as bytes (see is_wide())."""
+    actions = table_actions(table)
+    if len(actions) > 65535:
+        raise ValueError("Traces store up to 65535 actions per game")
+    thresholds = table_thresholds(table)
+    threshold_format, card_format = FIELDS[wide]
+    deck = table.deck
+    cards = deck.order[deck.tot_orig_cards - deck.tot_cards:]
+    bits = 0
+    for i, take in enumerate(actions):
+        if take:
+            bits |= 1 << i
+    return RECORD.pack(len(table.players), len(actions)) \
+           + struct.pack('<{}{}'.format(len(thresholds), threshold_format), \
+                         *thresholds) \
+           + struct.pack('<{}{}'.format(len(cards), card_format), *cards) \
+           + bits.to_bytes((len(actions) + 7) // 8, 'little')
+
+
+def decode(record, num_cards=33, offset=3, dis=9, wide=False):
+    """
+    Trace of a game from its record (bytes or a memoryview).
+
+    Returns:
+      Trace: deck setup, thresholds (one (init, eff_val, token, pot) tuple
+             per player), cards in draw order, and actions (list of bools,
+             True for a take)
+    """
+    threshold_format, card_format = FIELDS[wide]
+    num_players, num_actions = RECORD.unpack_from(record, 0)
+    start = RECORD.size
+    flat = struct.unpack_from('<{}{}'.format(4 * num_players, \
+                                             threshold_format), record, start)
+    thresholds = [flat[i:i + 4] for i in range(0, len(flat), 4)]
+    start += len(flat) * struct.calcsize(threshold_format)
+    cards = list(struct.unpack_from('<{}{}'.format(num_cards - dis, \
+                                                   card_format), record, start))
+    start += (num_cards - dis) * struct.calcsize(card_format)
+    bits = int.from_bytes(record[start:start + (num_actions + 7) // 8], \
+                          'little')
+    actions = [(bits >> i) & 1 == 1 for i in range(num_actions)]
+    return Trace(num_cards, offset, dis, thresholds, cards, actions)
+
+
+class TraceWriter(object):
+    """Appends game records to a trace file.
+
+    Records are buffered and written as one segment, with its own offset
+    index, every segment games (and on close()), so a file can grow over
+    any number of runs and is readable up to its last complete segment.
+    A segment holds games of a single deck setup and record width (see
+    is_wide()); a game with another setup starts a new one.
+
+    Methods:
+      add()
+      flush()
+      close()
+    """
+
+    def __init__(self, path, segment=65536):
+        """
+        Args:
+          path (str): trace file, appended to if it exists
+          segment (int): games per segment
+        """
+        self.file = open(path, 'ab')
+        self.segment = segment
+        self.setup = None
+        self.records = []
+        self.num_games = 0
+
+    def add(self, table):
+        """
+        Append the game of table, which must be over.
+
+        Raises:
+          ValueError: if the game cannot be stored (see is_wide())
+        """
+        deck = table.deck
+        setup = (deck.tot_orig_cards, deck.min_card, \
+                 deck.tot_orig_cards - deck.tot_cards, True)
+        # A narrow game fits a wide segment too.
+        if not is_wide(table) and setup != self.setup:
+            setup = setup[:3] + (False,)
+        wide = setup[3]
+        if setup != self.setup or len(self.records) >= self.segment:
+            self.flush()
+            self.setup = setup
+        self.records.append(encode(table, wide))
+        self.num_games += 1
+
+    def flush(self):
+        """Write the buffered records as a new segment."""
+        if not self.records:
+            return
+        offsets = [0]
+        for record in self.records:
+            offsets.append(offsets[-1] + len(record))
+        self.file.write(SEGMENT.pack(MAGIC, len(self.records), offsets[-1], \
+                                     *self.setup))
+        self.file.write(struct.pack('<{}I'.format(len(offsets)), *offsets))
+        self.file.write(b''.join(self.records))
+        self.file.flush()
+        self.records = []
+
+    def close(self):
+        self.flush()
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class TraceReader(object):
+    """Memory-mapped, random-access reader of a trace file.
+
+    Opening the file only walks the segment headers; game i is then found
+    by a bisection over segments and one lookup in its segment's offset
+    index, and its record is read straight from the mapped file.
+
+    Methods:
+      record()
+      setup()
+      __getitem__()
+      replay()
+    """
+
+    def __init__(self, path):
+        with open(path, 'rb') as f:
+            self.map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        # First game, index position and data position of each segment,
+        # and its deck setup and record width.
+        self.first = []
+        self.index = []
+        self.data = []
+        self.setups = []
+        num_games = 0
+        pos = 0
+        while pos + SEGMENT.size <= len(self.map):
+            magic, count, length, num_cards, offset, dis, wide = \
+                SEGMENT.unpack_from(self.map, pos)
+            if magic != MAGIC:
+                raise ValueError("{} is not a trace file".format(path))
+            index = pos + SEGMENT.size
+            data = index + (count + 1) * OFFSET.size
+            if data + length > len(self.map):
+                # A segment cut short while being written.
+                break
+            self.first.append(num_games)
+            self.index.append(index)
+            self.data.append(data)
+            self.setups.append((num_cards, offset, dis, wide == 1))
+            num_games += count
+            pos = data + length
+        self.num_games = num_games
+
+    def __len__(self):
+        return self.num_games
+
+    def locate(self, i):
+        """Segment of game i, and the start and end of its record."""
+        if i < 0:
+            i += self.num_games
+        if not 0 <= i < self.num_games:
+            raise IndexError("game {} not in trace".format(i))
+        segment = bisect.bisect_right(self.first, i) - 1
+        index = self.index[segment] + (i - self.first[segment]) * OFFSET.size
+        start, stop = struct.unpack_from('<2I', self.map, index)
+        data = self.data[segment]
+        return segment, data + start, data + stop
+
+    def record(self, i):
+        """Record of game i, as a memoryview of the mapped file."""
+        segment, start, stop = self.locate(i)
+        return memoryview(self.map)[start:stop]
+
+    def setup(self, i):
+        """(num_cards, offset, dis) of the deck of game i."""
+        return self.setups[self.locate(i)[0]][:3]
+
+    def __getitem__(self, i):
+        segment, start, stop = self.locate(i)
+        return decode(self.map[start:stop], *self.setups[segment])
+
+    def __iter__(self):
+        for i in range(self.num_games):
+            yield self[i]
+
+    def replay(self, i, moves=None, **table_args):
+        """replay() of game i."""
+        return replay(self[i], moves, **table_args)
+
+
+def replay(trace, moves=None, **table_args):
+    """
+    Rebuild a game from its trace.
+
+    Args:
+      trace (Trace): as from decode() or TraceReader
+      moves (int): number of actions to replay (default: all of them)
+      table_args: further keyword arguments for Table, e.g. verbose or
+              subscribers, which see the replayed moves
+
+    Returns:
+      Table: the game after moves actions, players' histories included
+    """
+    players = [Player(pos, *thresholds) \
+               for pos, thresholds in enumerate(trace.thresholds)]
+    dealt = set(trace.cards)
+    order = [card for card in range(trace.offset, \
+                                    trace.offset + trace.num_cards) \
+             if card not in dealt] + trace.cards
+    table_args.setdefault('verbose', 0)
+    mytable = Table(players=players, num_ai_players=0, \
+                    deck=Deck(trace.num_cards, trace.offset, trace.dis, \
+                              order=order), **table_args)
+    actions = trace.actions if moves is None else trace.actions[:moves]
+    for take in actions:
+        player = mytable.players[mytable.whose_turn]
+        player.eff_val = mytable.effective_value(mytable.whose_turn)
+        if take:
+            mytable.player_takes_card()
+        else:
+            mytable.player_passes()
+    return mytable
+
+
+def record_games(path, num_games, num_players=3, seed=0, **table_args):
+    """
+    Play num_games tournament games (see tournament.game_rng()) and append
+    their traces to path.
+    """
+    from tournament import game_rng
+    with TraceWriter(path) as writer:
+        mytable = Table(num_ai_players=num_players, verbose=0, \
+                        rng=game_rng(seed, 0), **table_args)
+        for game in range(num_games):
+            if game:
+                mytable.reset(rng=game_rng(seed, game))
+            mytable.play()
+            writer.add(mytable)